@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+'''
+Stress test of the history writers: N simulated shells hit their prompt at the same moment
+(tmux synchronize-panes, broadcast over ssh) and store the current directory, round after round.
+Coalescing writers (the current record_paths) are compared with the polling lock
+where every writer commits its own path.
+
+    python3 benchmarks/add_path_stress.py [--shells 8 32] [--rounds 20] [--modes coalesce spin]
+'''
+
+import os
+import sys
+import time
+import fcntl
+import argparse
+import tempfile
+import multiprocessing
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(ROOT_DIR)
+
+from fastcd import core
+
+
+def record_paths_spin(config, paths):
+    # previous implementation: lock is polled every 0.1s, every writer appends its own paths
+    history_filename = config["history_file"]
+    with open(core.get_history_lockfile(history_filename), "w+") as lock:
+        while True:
+            try:
+                fcntl.lockf(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except IOError:
+                time.sleep(0.1)
+        core.update_path_list(history_filename, paths, config["history_limit"], config["skip_list"], config["history_journal_size_limit"])
+
+
+MODES = {
+    "coalesce": core.record_paths,
+    "spin": record_paths_spin,
+}
+
+
+def shell(mode, config, number, rounds, barrier, latencies):
+    record = MODES[mode]
+    for round_number in range(rounds):
+        barrier.wait()
+        start = time.perf_counter()
+        record(config, ["/home/user/shell{}/round{}".format(number, round_number)])
+        latencies.put(time.perf_counter() - start)
+
+
+def run_case(mode, shells, rounds, history_size):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config = {
+            "history_file": os.path.join(tmpdir, "data", "history.txt"),
+            "history_limit": history_size + shells * rounds,
+            "history_journal_size_limit": 65536,
+            "skip_list": [],
+            "check_directory_existence": 0,
+        }
+        os.mkdir(os.path.dirname(config["history_file"]))
+        core.write_path_list(config["history_file"], ["/home/user/old{}".format(i) for i in range(history_size)])
+
+        barrier = multiprocessing.Barrier(shells)
+        latencies = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=shell, args=(mode, config, number, rounds, barrier, latencies))
+            for number in range(shells)
+        ]
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+        results = [latencies.get() for _ in range(shells * rounds)]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+
+        stored = set(core.read_path_list(config["history_file"]))
+        lost = sum(1 for number in range(shells) for round_number in range(rounds)
+                   if "/home/user/shell{}/round{}".format(number, round_number) not in stored)
+        results.sort()
+        return {
+            "elapsed": elapsed,
+            "throughput": shells * rounds / elapsed,
+            "median": results[len(results) // 2],
+            "max": results[-1],
+            "lost": lost,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent history writers stress test")
+    parser.add_argument("--shells", type=int, nargs="+", default=[8, 32], help="Numbers of simulated shells (default: 8 32)")
+    parser.add_argument("--rounds", type=int, default=20, help="Number of simultaneous prompts (default: 20)")
+    parser.add_argument("--modes", nargs="+", choices=sorted(MODES), default=["coalesce", "spin"], help="Writers to test (default: coalesce spin)")
+    parser.add_argument("--history-size", type=int, default=1000, help="Number of paths in the history (default: 1000)")
+    args = parser.parse_args()
+
+    print("{:>6} {:10} {:>9} {:>12} {:>10} {:>10} {:>5}".format("shells", "mode", "time", "paths/s", "median", "max", "lost"))
+    failed = False
+    for shells in args.shells:
+        for mode in args.modes:
+            result = run_case(mode, shells, args.rounds, args.history_size)
+            print("{:>6} {:10} {:8.3f}s {:12.1f} {:9.4f}s {:9.4f}s {:>5}".format(
+                shells, mode, result["elapsed"], result["throughput"], result["median"], result["max"], result["lost"]))
+            failed = failed or result["lost"] > 0
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+'''
+Memory used by the jumper's in-memory history on synthetic histories (see search_engines.py).
+Paths are read from the file as the jumper does, then the history store is built:
+    list - (path, exists) tuples with the corpus of string lists (previous store)
+    corpus - paths in the corpus buffer with the array of offsets, list of existence states
+
+    python3 benchmarks/history_memory.py [--sizes 100000 1000000] [--ascii]
+
+A single non-ascii path makes python store the whole corpus buffer with 2 or 4 bytes per character,
+--ascii drops non-ascii characters from the generated paths to measure the common case.
+'''
+
+import gc
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(ROOT_DIR)
+
+from fastcd import core, search
+from search_engines import generate_history
+
+
+class ListCorpus(object):
+    # previous corpus: strings and folded strings in lists, buffers are built for the batch search
+    def __init__(self, strings):
+        self.strings = list(strings)
+        self.folded = [search.fold_case(string) for string in self.strings]
+        self.buffers = {}
+
+    def get_buffer(self, case_sensitive):
+        if case_sensitive not in self.buffers:
+            strings = self.strings if case_sensitive else self.folded
+            offsets = []
+            pos = 0
+            for string in strings:
+                offsets.append(pos)
+                pos += len(string) + 1
+            self.buffers[case_sensitive] = ("\n".join(strings), offsets)
+        return self.buffers[case_sensitive]
+
+
+def build_list(paths):
+    stored_paths = list(zip(paths, [True] * len(paths)))
+    corpus = ListCorpus(path for path, _ in stored_paths)
+    # regex search is done in the buffer
+    corpus.get_buffer(False)
+    return stored_paths, corpus
+
+
+def build_corpus(paths):
+    states = [True] * len(paths)
+    return search.Corpus(paths), states
+
+
+STORES = {
+    "list": build_list,
+    "corpus": build_corpus,
+}
+
+
+def measure(store, filename):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    paths = core.read_lines(filename)
+    result = STORES[store](paths)
+    del paths
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="History store memory benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000], help="History sizes (default: 100000 1000000)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the history generator (default: 0)")
+    parser.add_argument("--ascii", action="store_true", help="Drop non-ascii characters from the paths")
+    args = parser.parse_args()
+
+    print("{:>8} {:8} {:>10} {:>10} {:>10} {:>9}".format("size", "store", "retained", "peak", "per path", "build"))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size in args.sizes:
+            filename = os.path.join(tmpdir, "history.txt")
+            paths = generate_history(size, args.seed)
+            if args.ascii:
+                paths = [path.encode("ascii", "ignore").decode("ascii") for path in paths]
+            core.write_path_list(filename, paths)
+            text_size = sum(len(path.encode("utf-8")) + 1 for path in paths)
+            del paths
+            print("{:>8} {:8} {:9.1f}M".format(size, "file", text_size / 2.0 ** 20))
+            for store in sorted(STORES, reverse=True):
+                current, peak, elapsed = measure(store, filename)
+                print("{:>8} {:8} {:9.1f}M {:9.1f}M {:9.0f}B {:8.2f}s".format(
+                    size, store, current / 2.0 ** 20, peak / 2.0 ** 20, float(current) / size, elapsed))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+'''
+Measures import time of the headless jumper path (--add-path, -l) using 'python -X importtime'.
+Fails if the total time exceeds the budget or if any forbidden module (urwid) is imported.
+
+    python3 benchmarks/importtime.py [--budget-ms 40] [--runs 5] [--top 10]
+'''
+
+import os
+import sys
+import argparse
+import subprocess
+
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+FORBIDDEN_MODULES = ["urwid"]
+
+
+def measure(module):
+    # returns {module name: (self us, cumulative us)}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + module],
+        cwd=ROOT_DIR,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True)
+    timings = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time budget for the headless jumper path")
+    parser.add_argument("--module", default="fastcd.jumper", help="Module to import (default: fastcd.jumper)")
+    parser.add_argument("--budget-ms", type=float, default=40.0, help="Maximum allowed import time (default: 40)")
+    parser.add_argument("--runs", type=int, default=5, help="Number of runs, the best one is taken (default: 5)")
+    parser.add_argument("--top", type=int, default=10, help="Number of the slowest modules to show (default: 10)")
+    args = parser.parse_args()
+
+    best = None
+    for _ in range(args.runs):
+        timings = measure(args.module)
+        total = sum(self_us for self_us, _ in timings.values())
+        if best is None or total < best[0]:
+            best = (total, timings)
+    total, timings = best
+
+    print("Import of {}: {:.2f}ms (budget {:.2f}ms)".format(args.module, total / 1000.0, args.budget_ms))
+    print("Slowest modules (cumulative):")
+    slowest = sorted(timings.items(), key=lambda x: x[1][1], reverse=True)[:args.top]
+    for name, (self_us, cumulative_us) in slowest:
+        print("  {:>10.2f}ms {:>10.2f}ms  {}".format(cumulative_us / 1000.0, self_us / 1000.0, name))
+
+    failed = False
+    for name in FORBIDDEN_MODULES:
+        if name in timings:
+            print("Forbidden module is imported: {}".format(name))
+            failed = True
+    if total / 1000.0 > args.budget_ms:
+        print("Import time budget exceeded")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+'''
+Search engines benchmark on synthetic histories.
+Results are written as json, two runs can be compared to find regressions.
+
+    python3 benchmarks/search_engines.py run [--sizes 1000 10000 100000] [--output results.json]
+    python3 benchmarks/search_engines.py compare base.json results.json [--threshold 10]
+'''
+
+import os
+import sys
+import json
+import time
+import bisect
+import random
+import argparse
+import platform
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(ROOT_DIR)
+
+from fastcd import search
+
+
+class GraphFuzzySearchEngine(search.FuzzySearchEngine):
+    # automaton walk over State objects instead of the transition tables
+    search_automaton = search.FuzzySearchEngine.search_automaton_graph
+
+
+ENGINES = {
+    "regex": (search.RegexSearchEngine, {}),
+    "fuzzy": (search.FuzzySearchEngine, {"narrowing_parts": ["/"]}),
+    "fuzzy-graph": (GraphFuzzySearchEngine, {"narrowing_parts": ["/"]}),
+    "bitap": (search.BitapSearchEngine, {"narrowing_parts": ["/"]}),
+}
+
+WORKLOADS = {
+    "literal": ["/src", "/fastcd", "/projects/web", "/var/log/nginx", "/Документы"],
+    "asterisk": ["/proj*/src", "/home*tests", "work*api*handlers", "/u*/l*/p*3"],
+    "eol": ["/src$", "tests$", "/build/*$", "/node_modules/*/lib$"],
+    "typo": ["/porjects", "/sevrices/api", "/fastdc", "/mnt/nfs/shraed"],
+    # long patterns that almost match, no matches at all, many asterisks
+    "adversarial": ["/" + "a" * 40 + "bba", "/projects/" * 6, "e*e*e*e*e*e*e$", "/zzzzzzzzzzzzzzzz", "*" * 8],
+}
+
+ROOTS = ["~", "~", "~", "~/projects", "~/projects", "/usr", "/var/log", "/etc", "/mnt/nfs", "/opt", "/tmp"]
+WORDS = [
+    "src", "lib", "tests", "docs", "build", "bin", "api", "web", "services", "handlers", "utils", "common",
+    "fastcd", "frontend", "backend", "node_modules", "python3", "site-packages", "nginx", "shared", "release",
+    "Downloads", "Documents", "Документы", "data", "scripts", "config", "include", "aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaabba",
+]
+
+
+def choose_words(rand, cumulative_weights, count):
+    return [WORDS[bisect.bisect(cumulative_weights, rand.random() * cumulative_weights[-1])] for _ in range(count)]
+
+
+def generate_history(size, seed=0):
+    '''
+    Returns list of unique paths in MRU order.
+    Directory names are taken with Zipf-like distribution, depth is mostly 2-6, sometimes up to 15.
+    Recent entries are deeper and share prefixes as a project tree is visited.
+    '''
+    rand = random.Random(seed)
+    cumulative_weights = []
+    total = 0
+    for rank in range(len(WORDS)):
+        total += 1.0 / (rank + 1)
+        cumulative_weights.append(total)
+    paths = []
+    seen = set()
+    prefix = None
+    while len(paths) < size:
+        # stay in the same project tree for a while
+        if prefix is None or rand.random() < 0.2:
+            prefix = [rand.choice(ROOTS)] + choose_words(rand, cumulative_weights, rand.randint(0, 2))
+        depth = min(int(rand.expovariate(0.35)) + 1, 15)
+        parts = prefix + choose_words(rand, cumulative_weights, depth)
+        # make the paths unique without losing the distribution
+        if rand.random() < 0.5:
+            parts.append("{}-{}".format(rand.choice(WORDS), len(paths)))
+        path = "/".join(parts)
+        if path not in seen:
+            seen.add(path)
+            paths.append(path)
+    return paths
+
+
+def measure(engine_name, pattern, corpus, repeat, page_size):
+    engine_class, options = ENGINES[engine_name]
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        engine = engine_class(pattern, False, **options)
+        compiled = time.perf_counter()
+        matches = engine.search_many(corpus)
+        searched = time.perf_counter()
+        stream = search.MatchStream(engine, corpus)
+        stream.fetch(page_size)
+        first_page = time.perf_counter()
+        timings = (compiled - start, searched - compiled, first_page - searched)
+        if best is None or sum(timings) < sum(best):
+            best = timings
+    return {
+        "compile_seconds": best[0],
+        "search_seconds": best[1],
+        "first_page_seconds": best[2],
+        "matches": len(matches),
+    }
+
+
+def get_key(result):
+    return (result["size"], result["engine"], result["workload"], result["pattern"])
+
+
+def run(args):
+    results = []
+    for size in args.sizes:
+        corpus = search.Corpus(generate_history(size, args.seed))
+        for engine_name in args.engines:
+            for workload in args.workloads:
+                total = 0
+                for pattern in WORKLOADS[workload]:
+                    result = measure(engine_name, pattern, corpus, args.repeat, args.page_size)
+                    result.update(size=size, engine=engine_name, workload=workload, pattern=pattern)
+                    results.append(result)
+                    total += result["search_seconds"]
+                print("{:>8} {:12} {:12} {:10.4f}s".format(size, engine_name, workload, total))
+
+    data = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "seed": args.seed,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as afile:
+            json.dump(data, afile, indent=2, ensure_ascii=False)
+        print("Results are written to '{}'".format(args.output))
+    return 0
+
+
+def compare(args):
+    with open(args.base) as afile:
+        base = {get_key(result): result for result in json.load(afile)["results"]}
+    with open(args.current) as afile:
+        current = json.load(afile)["results"]
+
+    regressions = 0
+    print("{:>8} {:12} {:12} {:>10} {:>10} {:>8}  {}".format("size", "engine", "workload", "base", "current", "change", "pattern"))
+    for result in current:
+        key = get_key(result)
+        if key not in base:
+            continue
+        before = base[key][args.metric]
+        after = result[args.metric]
+        # don't report noise of too fast cases
+        if max(before, after) < args.min_seconds:
+            continue
+        change = (after - before) / before * 100 if before else 0
+        mark = ""
+        if change > args.threshold:
+            mark = " !"
+            regressions += 1
+        if result["matches"] != base[key]["matches"]:
+            mark += " matches {} -> {}".format(base[key]["matches"], result["matches"])
+            regressions += 1
+        print("{:>8} {:12} {:12} {:10.4f} {:10.4f} {:+7.1f}%  {}{}".format(
+            result["size"], result["engine"], result["workload"], before, after, change, result["pattern"], mark))
+
+    if regressions:
+        print("Regressions found: {}".format(regressions))
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search engines benchmark")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    run_parser = subparsers.add_parser("run", help="Run benchmark")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="History sizes (default: 1000 10000 100000)")
+    run_parser.add_argument("--engines", nargs="+", choices=sorted(ENGINES), default=["regex", "fuzzy"], help="Engines to benchmark (default: regex fuzzy)")
+    run_parser.add_argument("--workloads", nargs="+", choices=sorted(WORKLOADS), default=sorted(WORKLOADS), help="Query workloads (default: all)")
+    run_parser.add_argument("--repeat", type=int, default=3, help="Number of runs, the best one is taken (default: 3)")
+    run_parser.add_argument("--page-size", type=int, default=64, help="Number of matches on the first page (default: 64)")
+    run_parser.add_argument("--seed", type=int, default=0, help="Seed of the history generator (default: 0)")
+    run_parser.add_argument("--output", help="Json file to write results to")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare results of two runs")
+    compare_parser.add_argument("base", help="Results of the base run")
+    compare_parser.add_argument("current", help="Results of the current run")
+    compare_parser.add_argument("--metric", choices=["search_seconds", "first_page_seconds", "compile_seconds"], default="search_seconds")
+    compare_parser.add_argument("--threshold", type=float, default=10.0, help="Allowed slowdown in percents (default: 10)")
+    compare_parser.add_argument("--min-seconds", type=float, default=0.01, help="Cases faster than this are ignored as noise (default: 0.01)")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
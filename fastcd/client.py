@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+'''
+Tiny client for the history daemon (see daemon.py).
+It's launched by the shell hook on every prompt, so it must not import anything heavy
+(socket module imports enum and selectors, the builtin _socket is used instead).
+Exits with non-zero code if the daemon is not running - the hook falls back to the jumper then.
+'''
+
+import os
+import sys
+import stat
+import _socket
+
+
+SOCKET_NAME = "fastcd.sock"
+
+
+def get_socket_path():
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if not runtime_dir:
+        runtime_dir = os.path.join("/tmp", "fastcd-{}".format(os.getuid()))
+    return os.path.join(runtime_dir, SOCKET_NAME)
+
+
+def is_private_dir(path):
+    # directory in /tmp might be created by another user to receive visited paths
+    try:
+        stats = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISDIR(stats.st_mode) and stats.st_uid == os.getuid() and stats.st_mode & 0o077 == 0
+
+
+def send_path(path, socket_path=None):
+    socket_path = socket_path or get_socket_path()
+    if not is_private_dir(os.path.dirname(socket_path)):
+        raise PermissionError("Socket directory is not private: '{}'".format(os.path.dirname(socket_path)))
+    sock = _socket.socket(_socket.AF_UNIX, _socket.SOCK_DGRAM)
+    try:
+        # don't hang the hook if the daemon's queue is full
+        sock.setblocking(False)
+        sock.sendto(os.fsencode(path), socket_path)
+    finally:
+        sock.close()
+
+
+def main():
+    if len(sys.argv) != 2:
+        return 2
+    try:
+        send_path(sys.argv[1])
+    except OSError:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
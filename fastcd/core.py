@@ -0,0 +1,712 @@
+# coding: utf-8
+
+import os
+import re
+import sys
+import stat
+import time
+import marshal
+import functools
+import itertools
+import collections
+from os.path import expanduser
+
+try:
+    from fastcd import util
+except ImportError:
+    from . import util
+
+
+# the merged config is cached, so the shell hook doesn't parse json files on every prompt
+CONFIG_CACHE_NAME = "config.marshal"
+# the environment is prepared for these paths
+ENVIRONMENT_STAMP_NAME = ".environment"
+CONFIG_PATHS = ["history_file", "shortcuts_paths_file", "user_config_file"]
+
+
+def read_config(ref_filename):
+    def expand_paths(config):
+        for param in CONFIG_PATHS:
+            if param in config:
+                config[param] = expanduser(config[param])
+        return config
+
+    ref_config = expand_paths(util.load_json(ref_filename))
+    if os.path.exists(ref_config["user_config_file"]):
+        usr_config = expand_paths(util.load_json(ref_config["user_config_file"]))
+        config = util.patch_dict(ref_config, usr_config)
+        config["user_config_file"] = ref_config["user_config_file"]
+        return config
+    return ref_config
+
+
+def get_config_cache_filename():
+    cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.join(util.HOMEDIR, ".cache")
+    return os.path.join(cache_dir, "fastcd", CONFIG_CACHE_NAME)
+
+
+def get_file_stamp(filename):
+    try:
+        stats = os.stat(filename)
+    except OSError:
+        return None
+    return (stats.st_ino, stats.st_size, stats.st_mtime_ns)
+
+
+def get_config_stamp(ref_filename, user_config_file):
+    # home is a part of the stamp - paths are expanded, marshal format depends on the python version
+    return (ref_filename, get_file_stamp(ref_filename), user_config_file, get_file_stamp(user_config_file),
+            util.HOMEDIR, tuple(sys.version_info[:2]))
+
+
+def load_cached_config(ref_filename, cache_filename):
+    '''
+    Returns merged config. It's cached while the reference and the user configs are not changed.
+    marshal is used because it's builtin - json and pickle imports cost more than the parsing.
+    '''
+    try:
+        with open(cache_filename, "rb") as afile:
+            stamp, config = marshal.load(afile)
+        if stamp == get_config_stamp(ref_filename, config["user_config_file"]):
+            return config
+    except Exception:
+        # missing or broken cache
+        pass
+
+    config = read_config(ref_filename)
+    stamp = get_config_stamp(ref_filename, config["user_config_file"])
+    now = time.time()
+    # file modified about the time of caching might be modified again unnoticed
+    if any(file_stamp and util.is_racy(file_stamp[2], now) for file_stamp in (stamp[1], stamp[3])):
+        return config
+    try:
+        dirname = os.path.dirname(cache_filename)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        util.write_file_atomically(cache_filename, marshal.dumps((stamp, config)))
+    except (IOError, OSError):
+        pass
+    return config
+
+
+def load_config():
+    return load_cached_config(util.get_reference_config_path(), get_config_cache_filename())
+
+
+def get_environment_stamp_filename(config):
+    return os.path.join(os.path.dirname(config["history_file"]), ENVIRONMENT_STAMP_NAME)
+
+
+def prepare_environment(config):
+    # nothing to do if the environment is already prepared for the same paths
+    stamp = "\n".join(config[param] for param in CONFIG_PATHS)
+    stamp_filename = get_environment_stamp_filename(config)
+    try:
+        with open(stamp_filename) as afile:
+            if afile.read() == stamp:
+                return
+    except (IOError, OSError):
+        pass
+
+    # create directories
+    for param in CONFIG_PATHS:
+        dirname = os.path.dirname(config[param])
+        if not os.path.exists(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                pass
+
+    # generate user config
+    user_config_file = config["user_config_file"]
+    if not os.path.exists(user_config_file):
+        with open(util.get_reference_config_path()) as afile:
+            data = afile.read()
+        # remove description warning
+        data = data[data.find("{"):]
+        with open(user_config_file, "w") as afile:
+            afile.write(data)
+
+    # create rest files
+    for param in ["history_file", "shortcuts_paths_file"]:
+        open(config[param], "a").close()
+
+    with open(stamp_filename, "w") as afile:
+        afile.write(stamp)
+
+
+def path_strip(path):
+    # root path
+    if path and path == "/":
+        return path
+    return path.rstrip("/")
+
+
+def normalize_path(path):
+    path = util.replace_home_with_tilde(path)
+    path = re.sub(r"/{2,}", r"/", path)
+    return path_strip(path)
+
+
+def translate_glob(pattern):
+    # '*' and '?' match '/' as well, the whole path must match
+    result = []
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        index += 1
+        if char == "*":
+            result.append(".*")
+        elif char == "?":
+            result.append(".")
+        elif char == "[" and "]" in pattern[index + 1:]:
+            end = pattern.index("]", index + 1)
+            chars = pattern[index:end]
+            if chars.startswith("!"):
+                chars = "^" + chars[1:]
+            result.append("[{}]".format(chars.replace("\\", "\\\\")))
+            index = end + 1
+        else:
+            result.append(re.escape(char))
+    return "".join(result)
+
+
+def get_path_forms(pattern):
+    # history paths are stored with tilde, the rest are absolute
+    home = expanduser("~")
+    pattern = expanduser(pattern)
+    if home != "/" and (pattern == home or pattern.startswith(home + "/")):
+        return [pattern, "~" + pattern[len(home):]]
+    return [pattern]
+
+
+class SkipList(object):
+    '''
+    Compiled skip_list. Patterns are regexes searched in the path, except for
+    'glob:PATTERN' - shell-like pattern matched against the whole path and
+    'prefix:PATH' - the path itself and all its subdirectories.
+    Prefixes are looked up in the trie of path parts, regexes and globs are combined into a single regex.
+    '''
+
+    # marks the end of the prefix in the trie
+    END = None
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self.trie = {}
+        regexes = []
+        separate = []
+        for pattern in self.patterns:
+            if pattern.startswith("prefix:"):
+                for path in get_path_forms(path_strip(pattern[len("prefix:"):])):
+                    self.add_prefix(path)
+            elif pattern.startswith("glob:"):
+                forms = get_path_forms(pattern[len("glob:"):])
+                regexes.append(r"\A(?:{})\Z".format("|".join(translate_glob(form) for form in forms)))
+            else:
+                # invalid patterns fail here, not in the combined regex
+                try:
+                    regex = re.compile(pattern)
+                except re.error as e:
+                    raise ValueError("Invalid skip_list pattern '{}': {}".format(pattern, e))
+                # group numbers are shifted in the combined regex, group names may be repeated in other patterns,
+                # global flags would apply to all patterns (python < 3.11 accepts them in the middle of the regex)
+                if re.search(r"\\[1-9]|\(\?P[<=]|\(\?[aiLmsux]+\)", pattern):
+                    separate.append(regex)
+                else:
+                    regexes.append(pattern)
+        self.regexes = separate
+        if regexes:
+            self.regexes.append(re.compile("|".join("(?:{})".format(regex) for regex in regexes)))
+        # compared with the stamp file on every update of the history
+        self.stamp = repr(self.patterns)
+
+    def add_prefix(self, path):
+        node = self.trie
+        for part in path.split("/"):
+            node = node.setdefault(part, {})
+        node[self.END] = True
+
+    def match_prefix(self, path):
+        node = self.trie
+        for part in path.split("/"):
+            node = node.get(part)
+            if node is None:
+                return False
+            if self.END in node:
+                return True
+        return False
+
+    def match(self, path):
+        if self.trie and self.match_prefix(path):
+            return True
+        for regex in self.regexes:
+            if regex.search(path):
+                return True
+        return False
+
+
+@functools.lru_cache(maxsize=8)
+def compile_patterns(patterns):
+    return SkipList(patterns)
+
+
+def compile_skip_list(skip_list):
+    if isinstance(skip_list, SkipList):
+        return skip_list
+    return compile_patterns(tuple(skip_list))
+
+
+def in_skip_list(path, skip_list):
+    return compile_skip_list(skip_list).match(path)
+
+
+# History consists of the compacted file (most recent path first)
+# and the append-only journal where every visit is a single record (most recent path last).
+# Journal is folded into the history when it exceeds the size limit.
+
+def get_journal_filename(filename):
+    return filename + ".journal"
+
+
+def read_lines(filename):
+    try:
+        with open(filename) as afile:
+            data = afile.read()
+    except (IOError, OSError):
+        return []
+    return [l.strip() for l in data.split("\n") if l.strip()]
+
+
+def fold_journal(paths, journal):
+    result = []
+    seen = set()
+    for path in reversed(journal):
+        if path not in seen:
+            seen.add(path)
+            result.append(path)
+    for path in paths:
+        if path not in seen:
+            seen.add(path)
+            result.append(path)
+    return result
+
+
+def read_path_list(filename):
+    # journal should be read first - it may be compacted in between
+    journal = read_lines(get_journal_filename(filename))
+    paths = read_lines(filename)
+    return fold_journal(paths, journal)
+
+
+def get_recent_path(filename, chunk_size=4096):
+    '''
+    Returns the most recent path of the history without reading the whole journal
+    or None if it's unknown (paths are waiting in the spool).
+    '''
+    try:
+        if os.listdir(get_spool_dirname(filename)):
+            return None
+    except OSError:
+        pass
+    try:
+        with open(get_journal_filename(filename), "rb") as afile:
+            afile.seek(0, os.SEEK_END)
+            size = afile.tell()
+            afile.seek(max(size - chunk_size, 0))
+            data = afile.read()
+    except (IOError, OSError):
+        size = 0
+        data = b""
+    lines = data.decode("utf-8", "surrogateescape").split("\n")
+    # the first line of the chunk might be incomplete
+    if size > chunk_size:
+        lines = lines[1:]
+    lines = [line.strip() for line in lines if line.strip()]
+    if lines:
+        return lines[-1]
+    # the journal is empty - the first path of the compacted history is the recent one
+    try:
+        with open(filename) as afile:
+            for line in afile:
+                if line.strip():
+                    return line.strip()
+    except (IOError, OSError):
+        pass
+    return None
+
+
+def write_path_list(filename, paths):
+    with open(filename + ".tmp", "w") as afile:
+        for path in paths:
+            afile.write("%s\n" % path)
+    # change file atomically
+    os.rename(filename + ".tmp", filename)
+
+
+def append_path_list(filename, paths):
+    data = "".join(["%s\n" % path for path in paths])
+    fd = os.open(get_journal_filename(filename), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, data.encode("utf-8", "surrogateescape"))
+        # returns journal size
+        return os.fstat(fd).st_size
+    finally:
+        os.close(fd)
+
+
+def get_skip_list_stamp_filename(filename):
+    # patterns of the skip list the history was filtered with
+    return filename + ".skip_list"
+
+
+def read_skip_list_stamp(filename):
+    try:
+        with open(get_skip_list_stamp_filename(filename)) as afile:
+            return afile.read().rstrip("\n")
+    except (IOError, OSError):
+        return None
+
+
+def compact_path_list(filename, limit, skip_list):
+    skip_list = compile_skip_list(skip_list)
+    stamp = skip_list.stamp
+    paths = read_path_list(filename)
+    # new paths are checked before they are added, so the whole history
+    # is filtered only when the skip list is changed - keep history clean
+    if read_skip_list_stamp(filename) != stamp:
+        paths = [p for p in paths if not skip_list.match(p)]
+    write_path_list(filename, paths[:limit])
+    with open(get_skip_list_stamp_filename(filename), "w") as afile:
+        afile.write(stamp + "\n")
+    open(get_journal_filename(filename), "w").close()
+
+
+def update_path_list(filename, paths, limit, skip_list, journal_size_limit):
+    # must be called under the history lock
+    skip_list = compile_skip_list(skip_list)
+    journal_size = append_path_list(filename, paths)
+    if journal_size > journal_size_limit or read_skip_list_stamp(filename) != skip_list.stamp:
+        compact_path_list(filename, limit, skip_list)
+
+
+def get_history_lockfile(history_filename):
+    return os.path.dirname(history_filename) + ".lock"
+
+
+# Concurrent writers are coalesced. A writer that can't take the history lock at once
+# puts its paths into the spool directory and waits for the lock. The lock holder commits
+# all spooled paths with a single journal append, so the waiting writers usually find
+# their paths already stored and just exit.
+
+# incomplete spool files of the crashed writers are removed after this time (seconds)
+SPOOL_TMP_TTL = 60
+# spool files of the same process (the daemon) are distinguished by the counter
+SPOOL_COUNTER = itertools.count()
+
+
+def get_spool_dirname(filename):
+    return filename + ".spool"
+
+
+def spool_paths(filename, paths):
+    # returns the spool file, names are ordered by time
+    dirname = get_spool_dirname(filename)
+    if not os.path.exists(dirname):
+        os.makedirs(dirname, exist_ok=True)
+    name = "{:017d}.{}.{}".format(int(time.time() * 10 ** 6), os.getpid(), next(SPOOL_COUNTER))
+    spool_filename = os.path.join(dirname, name)
+    # incomplete files are hidden
+    tmp_filename = os.path.join(dirname, "." + name)
+    with open(tmp_filename, "w") as afile:
+        afile.write("".join(["%s\n" % path for path in paths]))
+    os.rename(tmp_filename, spool_filename)
+    return spool_filename
+
+
+def read_spool(filename):
+    # must be called under the history lock, returns spooled paths and the spool files
+    dirname = get_spool_dirname(filename)
+    try:
+        names = sorted(os.listdir(dirname))
+    except OSError:
+        return [], []
+    paths = []
+    spool_filenames = []
+    for name in names:
+        spool_filename = os.path.join(dirname, name)
+        if name.startswith("."):
+            try:
+                if time.time() - os.stat(spool_filename).st_mtime > SPOOL_TMP_TTL:
+                    os.unlink(spool_filename)
+            except OSError:
+                pass
+            continue
+        paths.extend(read_lines(spool_filename))
+        spool_filenames.append(spool_filename)
+    return paths, spool_filenames
+
+
+def commit_paths(filename, paths, limit, skip_list, journal_size_limit):
+    # must be called under the history lock
+    spooled, spool_filenames = read_spool(filename)
+    # the lock holder came first, the waiting writers spooled their paths later
+    paths = paths + spooled
+    if paths:
+        update_path_list(filename, paths, limit, skip_list, journal_size_limit)
+    # spool files are removed after the commit - paths may be duplicated by a crash, but not lost
+    for spool_filename in spool_filenames:
+        try:
+            os.unlink(spool_filename)
+        except OSError:
+            pass
+
+
+def get_shortcut_path(filename, path_index):
+    if not os.path.exists(filename):
+        return ""
+    with open(filename) as afile:
+        data = afile.read()
+    for num, line in enumerate(data.split("\n")):
+        if num == path_index:
+            return util.get_nearest_existing_dir(expanduser(line)) or ""
+    return ""
+
+
+def get_shortcut_paths(filename, number):
+    paths = []
+    if os.path.exists(filename):
+        with open(filename) as afile:
+            paths = [line.strip() for line in afile.readlines()]
+    while len(paths) < number:
+        paths.append("")
+    return paths[:number]
+
+
+def store_shortcut_path(filename, path, path_index):
+    stored_paths = []
+    # the file might be removed after the environment was prepared
+    if os.path.exists(filename):
+        with open(filename) as afile:
+            stored_paths = [line.strip() for line in afile.readlines()]
+    # extend list
+    for _ in range(path_index + 1 - len(stored_paths)):
+        stored_paths.append("")
+    stored_paths[path_index] = path
+
+    with open(filename, "w") as afile:
+        for path in stored_paths:
+            afile.write(path + "\n")
+
+
+class ExistenceCache(object):
+    '''
+    Stores results of the directories existence checks between launches.
+    Every record is a line: 'exists<TAB>check time<TAB>parent dir mtime (ns)<TAB>path'.
+    New records may be appended by the --add-path writer, the last record wins.
+    '''
+
+    def __init__(self, filename, ttl):
+        self.filename = filename
+        self.ttl = ttl
+        # path -> (exists, check time, parent mtime)
+        self.entries = {}
+        self.dirty = False
+
+    def load(self):
+        lines = read_lines(self.filename)
+        for line in lines:
+            fields = line.split("\t", 3)
+            if len(fields) != 4:
+                continue
+            exists, checked, parent_mtime, path = fields
+            try:
+                self.entries[path] = (exists == "1", float(checked), int(parent_mtime))
+            except ValueError:
+                continue
+        # compact appended records
+        self.dirty = len(lines) != len(self.entries)
+
+    def save(self):
+        if not self.dirty:
+            return
+        records = [format_existence_record(path, *entry) for path, entry in self.entries.items()]
+        util.write_file_atomically(self.filename, "".join(records))
+        self.dirty = False
+
+    def get(self, path):
+        return self.entries.get(path)
+
+    def is_fresh(self, entry, now):
+        return now - entry[1] < self.ttl
+
+    def retain(self, paths):
+        paths = set(paths)
+        for path in list(self.entries):
+            if path not in paths:
+                del self.entries[path]
+                self.dirty = True
+
+    def update(self, path, exists, parent_mtime, checked=None):
+        self.entries[path] = (exists, checked or time.time(), parent_mtime)
+        self.dirty = True
+
+
+def get_existence_cache_filename(config):
+    return os.path.join(os.path.dirname(config["history_file"]), "existence_cache.txt")
+
+
+def format_existence_record(path, exists, checked, parent_mtime):
+    return "{}\t{}\t{}\t{}\n".format(int(exists), int(checked), parent_mtime, path)
+
+
+def append_existence_records(filename, paths):
+    # paths are known to exist - they were just visited
+    records = []
+    now = time.time()
+    for path in paths:
+        path = expanduser(path)
+        try:
+            parent_mtime = os.stat(os.path.dirname(path)).st_mtime_ns
+        except OSError:
+            continue
+        records.append(format_existence_record(path, True, now, parent_mtime))
+    with open(filename, "a") as afile:
+        afile.write("".join(records))
+
+
+def escape_name(name):
+    # tabs and newlines of the names don't break the records
+    return name.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
+def unescape_name(name):
+    if "\\" not in name:
+        return name
+    return re.sub(r"\\(.)", lambda match: {"t": "\t", "n": "\n"}.get(match.group(1), match.group(1)), name)
+
+
+class ListingCache(object):
+    '''
+    Stores subdirectories of the directories (for the autocompletion) between launches.
+    Listing is valid while the mtime of the directory is not changed.
+    Every record is a line: 'mtime (ns)<TAB>list time<TAB>path<TAB>subdirectories separated by '/'',
+    where tabs, newlines and backslashes of the names are escaped, records are ordered from the least recently used.
+    Directory is validated (stat) at most once per revalidate_interval (seconds) in the session,
+    so the checks on every keystroke don't hit the file system.
+    '''
+
+    def __init__(self, filename, limit, revalidate_interval=1.0):
+        # the cache is filled by the prefetcher's threads as well (the module is imported lazily, it's not needed by the writers)
+        import threading
+        self.filename = filename
+        self.limit = limit
+        self.revalidate_interval = revalidate_interval
+        # path -> (mtime, list time, subdirectories)
+        self.entries = collections.OrderedDict()
+        # path -> time of the last validation in the session
+        self.validated = {}
+        self.loaded = False
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        self.loaded = True
+        try:
+            with open(self.filename) as afile:
+                lines = afile.read().split("\n")
+        except (IOError, OSError):
+            return
+        # lines aren't stripped - names may start or end with spaces
+        for line in lines:
+            fields = line.split("\t", 3)
+            if len(fields) != 4:
+                continue
+            mtime, listed, path, dirs = fields
+            dirs = [unescape_name(name) for name in dirs.split("/")] if dirs else []
+            try:
+                self.entries[unescape_name(path)] = (int(mtime), float(listed), dirs)
+            except ValueError:
+                continue
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            while len(self.entries) > self.limit:
+                self.entries.popitem(last=False)
+            records = []
+            for path, (mtime, listed, dirs) in self.entries.items():
+                records.append("{}\t{}\t{}\t{}\n".format(mtime, listed, escape_name(path), "/".join(escape_name(name) for name in dirs)))
+            util.write_file_atomically(self.filename, "".join(records))
+            self.dirty = False
+
+    def is_valid(self, entry, mtime):
+        return entry[0] == mtime and not util.is_racy(mtime, entry[1])
+
+    def get_dirs(self, path):
+        '''
+        Returns list of subdirectories sorted case insensitively or None if path is not a directory.
+        '''
+        now = time.time()
+        with self.lock:
+            if not self.loaded:
+                self.load()
+            entry = self.entries.get(path)
+            if entry and now - self.validated.get(path, 0) < self.revalidate_interval:
+                return entry[2]
+
+        # file system is accessed without the lock
+        try:
+            stats = os.stat(path)
+        except OSError:
+            stats = None
+        if stats is None or not stat.S_ISDIR(stats.st_mode):
+            with self.lock:
+                if self.entries.pop(path, None):
+                    self.dirty = True
+            return None
+        if entry is None or not self.is_valid(entry, stats.st_mtime_ns):
+            try:
+                dirs = sorted(util.get_dirs(path), key=str.lower)
+            except OSError:
+                return None
+            entry = (stats.st_mtime_ns, now, dirs)
+
+        with self.lock:
+            self.entries[path] = entry
+            self.entries.move_to_end(path)
+            self.dirty = True
+            self.validated[path] = now
+        return entry[2]
+
+
+def get_listing_cache_filename(config):
+    return os.path.join(os.path.dirname(config["history_file"]), "listing_cache.txt")
+
+
+def record_paths(config, paths):
+    # paths must be normalized
+    history_filename = config["history_file"]
+    params = (config["history_limit"], config["skip_list"], config["history_journal_size_limit"])
+    with open(get_history_lockfile(history_filename), "w+") as lock:
+        if util.try_lockfile(lock):
+            commit_paths(history_filename, paths, *params)
+        else:
+            spool_filename = spool_paths(history_filename, paths)
+            util.obtain_lockfile(lock)
+            # nothing to do if the paths are committed by the previous lock holder
+            if os.path.exists(spool_filename):
+                commit_paths(history_filename, [], *params)
+    if config["check_directory_existence"]:
+        append_existence_records(get_existence_cache_filename(config), paths)
+
+
+def add_path(config, path):
+    if in_skip_list(path, config["skip_list"]):
+        return
+    path = normalize_path(path)
+    # the hook may report the same directory again (new shell, bash without directory change)
+    if get_recent_path(config["history_file"]) == path:
+        return
+    record_paths(config, [path])
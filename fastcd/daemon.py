@@ -0,0 +1,206 @@
+# coding: utf-8
+
+'''
+Resident history daemon.
+Keeps config and pending history records in memory and receives visited paths from the shell hook
+through the unix datagram socket (see client.py). Paths are flushed to the history file in batches.
+'''
+
+import os
+import sys
+import time
+import fcntl
+import signal
+import socket
+import select
+import traceback
+
+try:
+    from fastcd import client, core
+except ImportError:
+    from . import client, core
+
+# the hook appends errors of the jumper to the same file
+ERRORS_LOG_NAME = "errors.log"
+
+
+class DaemonError(Exception):
+    pass
+
+
+class HistoryDaemon(object):
+
+    def __init__(self, config, socket_path=None):
+        self.config = config
+        self.skip_list = core.compile_skip_list(config["skip_list"])
+        self.socket_path = socket_path or client.get_socket_path()
+        self.sock = None
+        self.pending = []
+        self.first_pending_time = None
+        # failed flush is retried after daemon_flush_interval, not on every received path
+        self.flush_failed = False
+        self.reload_requested = False
+        self.stop_requested = False
+        # signal handlers wake the loop through the pipe - select() is restarted after a signal (PEP 475)
+        self.wakeup_fds = None
+
+    def bind(self):
+        dirname = os.path.dirname(self.socket_path)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname, mode=0o700)
+        if not client.is_private_dir(dirname):
+            raise DaemonError("Socket directory must be owned by the user and not accessible by others: '{}'".format(dirname))
+
+        if os.path.exists(self.socket_path):
+            try:
+                # empty message is a ping
+                client.send_path("", self.socket_path)
+            except OSError:
+                # stale socket left by the killed daemon
+                os.unlink(self.socket_path)
+            else:
+                raise DaemonError("Daemon is already running: '{}'".format(self.socket_path))
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        self.sock.setblocking(False)
+        self.wakeup_fds = os.pipe()
+        # signal handler must not block on the full pipe
+        fcntl.fcntl(self.wakeup_fds[1], fcntl.F_SETFL, fcntl.fcntl(self.wakeup_fds[1], fcntl.F_GETFL) | os.O_NONBLOCK)
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+        if self.wakeup_fds:
+            for fd in self.wakeup_fds:
+                os.close(fd)
+            self.wakeup_fds = None
+
+    def wake_up(self):
+        try:
+            os.write(self.wakeup_fds[1], b"\0")
+        except (OSError, TypeError):
+            # the pipe is full (the loop will wake up anyway) or closed
+            pass
+
+    def request_reload(self):
+        self.reload_requested = True
+        self.wake_up()
+
+    def stop(self):
+        self.stop_requested = True
+        self.wake_up()
+
+    def serve(self):
+        if self.sock is None:
+            self.bind()
+        try:
+            while not self.stop_requested:
+                ready, _, _ = select.select([self.sock, self.wakeup_fds[0]], [], [], self.get_flush_timeout())
+                if self.wakeup_fds[0] in ready:
+                    try:
+                        os.read(self.wakeup_fds[0], 4096)
+                    except OSError:
+                        pass
+                if self.reload_requested:
+                    self.reload_config()
+                if self.sock in ready:
+                    self.receive()
+                if self.is_flush_required():
+                    self.flush()
+        finally:
+            self.close()
+            self.flush()
+
+    def receive(self):
+        while True:
+            try:
+                data = self.sock.recv(4096)
+            except (BlockingIOError, InterruptedError):
+                return
+            path = os.fsdecode(data)
+            if path:
+                self.add_path(path)
+
+    def add_path(self, path):
+        if self.skip_list.match(path):
+            return
+        path = core.normalize_path(path)
+        # several shells in the same directory
+        if self.pending and self.pending[-1] == path:
+            return
+        if not self.pending:
+            self.first_pending_time = time.time()
+        self.pending.append(path)
+
+    def get_flush_timeout(self):
+        if not self.pending:
+            return None
+        passed = time.time() - self.first_pending_time
+        return max(self.config["daemon_flush_interval"] - passed, 0)
+
+    def is_flush_required(self):
+        if not self.pending:
+            return False
+        if len(self.pending) >= self.config["daemon_flush_batch"] and not self.flush_failed:
+            return True
+        return self.get_flush_timeout() == 0
+
+    def flush(self):
+        if not self.pending:
+            return
+        try:
+            core.record_paths(self.config, self.pending)
+        except (OSError, IOError):
+            # the batch is kept for the next flush, the daemon must not die on a full disk
+            self.log_error()
+            self.flush_failed = True
+            self.first_pending_time = time.time()
+            return
+        self.pending = []
+        self.first_pending_time = None
+        self.flush_failed = False
+
+    def log_error(self):
+        message = "{} fastcd daemon: failed to store {} paths\n{}".format(
+            time.strftime("%Y-%m-%d %H:%M:%S"), len(self.pending), traceback.format_exc())
+        try:
+            with open(get_errors_log_filename(self.config), "a") as afile:
+                afile.write(message)
+        except (OSError, IOError):
+            sys.stderr.write(message)
+
+    def reload_config(self):
+        self.reload_requested = False
+        self.flush()
+        self.config = core.load_config()
+        self.skip_list = core.compile_skip_list(self.config["skip_list"])
+
+
+def get_errors_log_filename(config):
+    return os.path.join(os.path.dirname(config["history_file"]), ERRORS_LOG_NAME)
+
+
+def run(config, socket_path=None):
+    daemon = HistoryDaemon(config, socket_path)
+    try:
+        daemon.bind()
+    except (DaemonError, OSError) as e:
+        sys.exit("fastcd: {}".format(e))
+
+    def handler_stop(signum, frame):
+        daemon.stop()
+
+    def handler_reload(signum, frame):
+        daemon.request_reload()
+
+    signal.signal(signal.SIGTERM, handler_stop)
+    signal.signal(signal.SIGINT, handler_stop)
+    signal.signal(signal.SIGHUP, handler_reload)
+    daemon.serve()
@@ -0,0 +1,874 @@
+# coding: utf-8
+
+import os
+import signal
+import shutil
+import threading
+from os.path import expanduser
+
+try:
+    import urwid
+except ImportError:
+    print("Cannot import urwid module. Install it first 'sudo pip3 install urwid' or 'python3 -mpip install --user urwid'")
+    exit(1)
+
+URWID_VERSION = urwid.__version__.split(".")
+if float(URWID_VERSION[0] + "." + URWID_VERSION[1]) < 1.1:
+    print("Old urwid version detected (%s). Please, upgrade it first 'sudo pip3 install --upgrade urwid'" % urwid.__version__)
+    exit(1)
+
+try:
+    from fastcd import util, search, probe, stages, indexer
+    from fastcd.core import path_strip, read_path_list, get_shortcut_path, store_shortcut_path, ExistenceCache, get_existence_cache_filename, \
+        ListingCache, get_listing_cache_filename
+except ImportError:
+    from . import util, search, probe, stages, indexer
+    from .core import path_strip, read_path_list, get_shortcut_path, store_shortcut_path, ExistenceCache, get_existence_cache_filename, \
+        ListingCache, get_listing_cache_filename
+
+
+class PathWidget(urwid.WidgetWrap):
+
+    def __init__(self, path="", exists=True, shift=2):
+        self.path = path
+
+        if not isinstance(path, (str, tuple)):
+            raise TypeError("Path must be str or three-element tuple")
+
+        if exists:
+            color = 'text'
+            items = [
+                ('fixed', shift, urwid.Text(""))
+            ]
+        elif exists is probe.UNKNOWN:
+            # existence check timed out
+            color = 'minor'
+            items = [
+                ('fixed', shift, urwid.Text("?"))
+            ]
+        else:
+            color = 'minor'
+            items = [
+                ('fixed', shift, urwid.Text("*"))
+            ]
+
+        if isinstance(self.path, tuple):
+            before, match, after = self.path
+            text = urwid.AttrWrap(urwid.Text([before, ('match', match), after]), color, 'selected')
+            items.append(text)
+        else:
+            items.append(urwid.AttrWrap(urwid.Text(self.path), color, 'selected'))
+        super(PathWidget, self).__init__(urwid.Columns(items, focus_column=1))
+
+    def get_path(self):
+        if isinstance(self.path, str):
+            return self.path
+        return "".join(self.path)
+
+    def selectable(self):
+        return True
+
+    def keypress(self, size, key):
+        return key
+
+
+class PathListWalker(urwid.ListWalker):
+    '''
+    Stores (index of stored path, match span, exists) entries only, paths are taken from the corpus strings.
+    PathWidgets are built on demand for the rows requested by the listbox and cached.
+    Entries of the filtered list are taken from the match stream, which is advanced
+    when the listbox goes past the last found entry.
+    '''
+
+    def __init__(self, paths, states, page_size=100):
+        self.paths = paths
+        self.states = states
+        self.page_size = page_size
+        self.entries = []
+        self.stream = None
+        self.widgets = {}
+        self.focus = 0
+
+    def set_entries(self, entries):
+        self.entries = entries
+        self.stream = None
+        self.widgets = {}
+        self.focus = 0
+        self._modified()
+
+    def set_stream(self, stream):
+        self.set_entries([])
+        self.stream = stream
+        self.fetch(0)
+
+    def fetch(self, position):
+        # search for entries up to the position and one page more
+        if self.stream is None or position < len(self.entries):
+            return
+        self.stream.fetch(position + 1 + self.page_size)
+        for index, start, end in self.stream.matches[len(self.entries):]:
+            self.entries.append((index, (start, end), self.states[index]))
+        if self.stream.exhausted:
+            self.stream = None
+
+    def get_widget(self, position):
+        widget = self.widgets.get(position)
+        if widget is None:
+            index, span, exists = self.entries[position]
+            path = self.paths[index]
+            if span:
+                start, end = span
+                # before, match, after
+                path = (path[:start], path[start:end], path[end:])
+            widget = PathWidget(path, exists=exists)
+            self.widgets[position] = widget
+        return widget
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, position):
+        self.fetch(position)
+        if position < 0 or position >= len(self.entries):
+            raise IndexError(position)
+        return self.get_widget(position)
+
+    def next_position(self, position):
+        self.fetch(position + 1)
+        if position + 1 >= len(self.entries):
+            raise IndexError(position)
+        return position + 1
+
+    def prev_position(self, position):
+        if position <= 0:
+            raise IndexError(position)
+        return position - 1
+
+    def positions(self, reverse=False):
+        if reverse:
+            # all entries are required
+            if self.stream:
+                self.stream.fetch()
+                self.fetch(len(self.stream.matches))
+            return range(len(self.entries) - 1, -1, -1)
+        return range(len(self.entries))
+
+    def get_focus(self):
+        if not self.entries:
+            return None, None
+        return self.get_widget(self.focus), self.focus
+
+    def set_focus(self, position):
+        self.focus = position
+        self._modified()
+
+    def get_next(self, position):
+        self.fetch(position + 1)
+        if position + 1 >= len(self.entries):
+            return None, None
+        return self.get_widget(position + 1), position + 1
+
+    def get_prev(self, position):
+        if position <= 0:
+            return None, None
+        return self.get_widget(position - 1), position - 1
+
+
+class AutoCompletionPopup(urwid.WidgetWrap):
+
+    def __init__(self, max_height, min_width):
+        self.max_height = max_height
+        self.min_width = min_width
+        self.is_opened = False
+        self.height = 1
+        self.width = 1
+        self.prefix = ""
+        self.listbox = urwid.ListBox(urwid.SimpleListWalker([]))
+        self.pile = urwid.Pile([urwid.LineBox(urwid.BoxAdapter(self.listbox, self.height))])
+
+        fill = urwid.Filler(self.pile)
+        super().__init__(urwid.AttrWrap(fill, 'match'))
+
+    def update(self, paths, prefix):
+        self.prefix = prefix
+        self.width = self.min_width
+        items = []
+        for path in paths:
+            self.width = max(self.width, len(path))
+            prev_len = len(prefix)
+            path_tuple = ("", path[:prev_len], path[prev_len:])
+            items.append(PathWidget(path_tuple, shift=0))
+
+        self.listbox.body[:] = urwid.SimpleListWalker(items)
+        if items:
+            self.listbox.set_focus(0)
+
+        self.height = min(len(items), self.max_height)
+        linebox = urwid.LineBox(urwid.BoxAdapter(self.listbox, self.height))
+        self.pile.contents[0] = (linebox, ('weight', 1))
+
+    def get_selected(self):
+        if self.listbox.body:
+            return self.listbox.get_focus()[0]
+
+    def get_height(self):
+        return self.height
+
+    def get_width(self):
+        return self.width
+
+
+class PathFilterWidget(urwid.PopUpLauncher):
+
+    def __init__(self, listing_cache):
+        self.listing_cache = listing_cache
+        self.path_edit = urwid.AttrWrap(urwid.Edit(), 'input')
+        # TODO calc in %
+        self.popup = AutoCompletionPopup(20, 20)
+
+        super(PathFilterWidget, self).__init__(self.path_edit)
+
+    def parse_path(self, path):
+        if "/" in path:
+            path, prefix = path.rsplit("/", 1)
+            # in this case '/' is not separator, it's path to the root (/)
+            if not path:
+                path = "/"
+            # existence check and listing are served from the cache
+            dirs = self.listing_cache.get_dirs(expanduser(path))
+            if dirs is not None:
+                if prefix:
+                    dirs = [d for d in dirs if d.lower().startswith(prefix.lower())]
+                return path, dirs, prefix
+        return path, [], ""
+
+    def autocomplete(self):
+        path = self.get_text()
+        path, dirs, prefix = self.parse_path(path)
+        # there is only one directory
+        if len(dirs) == 1:
+            self.set_text(os.path.join(path, dirs[0]) + "/")
+            self.close_popup()
+        # show candidates
+        elif dirs:
+            self.popup.update(dirs, prefix)
+            self.open_popup()
+
+    def is_popup_opened(self):
+        return self.popup.is_opened
+
+    def close_popup(self):
+        self.close_pop_up()
+        self.popup.is_opened = False
+
+    def open_popup(self):
+        self.open_pop_up()
+        self.popup.is_opened = True
+
+    def set_text(self, text):
+        self.path_edit.set_edit_text(text)
+        self.path_edit.set_edit_pos(len(text))
+
+    def get_text(self):
+        return self.path_edit.get_edit_text()
+
+    def create_pop_up(self):
+        return self.popup
+
+    def keypress(self, size, key):
+        self.path_edit.keypress(size, key)
+        # update popup's content
+        if self.is_popup_opened():
+            path = self.get_text()
+            path, dirs, prefix = self.parse_path(path)
+            if dirs:
+                self.popup.update(dirs, prefix)
+            else:
+                self.close_popup()
+        return key
+
+    def get_popup_left_pos(self):
+        return len(self.get_text()) - len(self.popup.prefix) - 1
+
+    def get_pop_up_parameters(self):
+        return {
+            'left': self.get_popup_left_pos(),
+            'top': 1,
+            'overlay_width': self.popup.get_width() + 2,  # 2 is border of linebox
+            'overlay_height': self.popup.get_height() + 2,
+        }
+
+
+class SearchWorker(object):
+    '''
+    Runs searches in the background thread, so typing is never blocked by the search.
+    Only the latest request is processed: pending request is replaced by the new one
+    and the running search is abandoned between chunks if it's superseded.
+    Match stream is advanced up to the requested number of matches and delivered
+    to the urwid main loop through the pipe and passed to the callback.
+    Exception of the search is delivered the same way to the error_callback, the worker keeps running.
+    '''
+
+    def __init__(self, loop, callback, error_callback=None):
+        self.callback = callback
+        self.error_callback = error_callback
+        self.cond = threading.Condition()
+        # generation of the latest request, results of the older ones are dropped
+        self.generation = 0
+        # generation of the last delivered or cancelled request
+        self.completed = 0
+        self.request = None
+        self.result = None
+        self.pipe = loop.watch_pipe(self.on_result)
+        thread = threading.Thread(target=self.work)
+        thread.daemon = True
+        thread.start()
+
+    def submit(self, stream, count, payload):
+        with self.cond:
+            self.generation += 1
+            self.request = (self.generation, stream, count, payload)
+            self.cond.notify()
+
+    def cancel(self):
+        with self.cond:
+            self.generation += 1
+            self.completed = self.generation
+            self.request = None
+
+    def is_pending(self):
+        return self.completed != self.generation
+
+    def work(self):
+        while True:
+            with self.cond:
+                while self.request is None:
+                    self.cond.wait()
+                generation, stream, count, payload = self.request
+                self.request = None
+            error = None
+            try:
+                if not stream.fetch(count, cancelled=lambda: generation != self.generation):
+                    continue
+            except Exception as e:
+                error = e
+            with self.cond:
+                if generation != self.generation:
+                    continue
+                self.result = (generation, stream, payload, error)
+            os.write(self.pipe, b"\n")
+
+    def on_result(self, data):
+        with self.cond:
+            result, self.result = self.result, None
+            if result is None or result[0] != self.generation:
+                return True
+            self.completed = result[0]
+        _, stream, payload, error = result
+        if error is None:
+            self.callback(stream, payload)
+        elif self.error_callback:
+            self.error_callback(error, payload)
+        # keep the pipe open
+        return True
+
+
+class Display(object):
+
+    def __init__(self, config):
+        self.config = config
+        self.shortcuts = self.config["shortcuts"]
+        self.selected_path = ""
+        # the history is stored in the corpus (see search.Corpus), states are existence states of the paths
+        self.corpus = None
+        self.states = []
+        self.header_pile = None
+        self.info_text_header = None
+        self.listbox = None
+        self.search_engine_label = None
+        self.path_filter = None
+        self.view = None
+        self.case_sensitive = bool(self.config["enable_case_sensitive_search"])
+        self.fuzzy_search = bool(self.config["enable_fuzzy_search"])
+        # search will look for matches from the beginning of the directory name if false
+        self.search_from_any_pos = bool(self.config["search_from_any_pos"])
+        self.search_engine_label_limit = 20
+        self.search_offset = 0
+        # last search parameters and indices of matched stored paths
+        self.last_search = None
+        self.last_engine = None
+        self.last_stream = None
+        self.search_cache = util.LRUCache(self.config["search_cache_size"])
+        self.search_worker = None
+        self.previously_selected_nonexistent_path = ""
+        # select by default oldpwd or last visited if there is no oldpwd
+        self.default_selected_item_index = 1
+        self.shortcuts_paths_filename = self.config["shortcuts_paths_file"]
+        self.shortcuts_cache = set()
+        # shortcuts which use the selected path
+        self.focus_shortcuts = set()
+        for name in ["cd_selected_path", "copy_selected_path_to_clipboard", "autocomplete", "paste_selected_path", "store_shortcut_path"]:
+            self.focus_shortcuts.update(self.shortcuts[name])
+        self.existence_checker = probe.ExistenceChecker(
+            threads=self.config["existence_check_threads"],
+            path_timeout=self.config["existence_check_timeout_ms"] / 1000.0,
+            mount_timeout=self.config["existence_check_mount_timeout_ms"] / 1000.0)
+        self.listing_cache = ListingCache(get_listing_cache_filename(self.config), self.config["listing_cache_size"])
+        self.prefetcher = probe.ListingPrefetcher(self.listing_cache, threads=self.config["prefetch_threads"])
+        self.prefetched_filter_path = None
+        paths, self.states = self.get_stored_paths()
+        # indexed paths follow the history ones, they are shown only in search results
+        self.history_size = len(paths)
+        indexed_paths = self.get_indexed_paths(paths)
+        self.states += [True] * len(indexed_paths)
+        self.corpus = search.Corpus(paths + indexed_paths)
+
+        if self.history_size < 2:
+            self.default_selected_item_index = 0
+
+        signal.signal(signal.SIGINT, Display.handler_sigint)
+
+    @staticmethod
+    def handler_sigint(signum, frame):
+        raise urwid.ExitMainLoop()
+
+    def run(self):
+        stages.start("widgets")
+        list_walker = PathListWalker(self.corpus.strings, self.states, self.get_page_size())
+        list_walker.set_entries(self.get_all_entries())
+        self.listbox = urwid.ListBox(list_walker)
+        if self.history_size:
+            self.listbox.set_focus(self.default_selected_item_index)
+
+        self.path_filter = PathFilterWidget(self.listing_cache)
+        self.search_engine_label = urwid.AttrWrap(urwid.Text(self.get_search_engine_label_text(), align='right'), 'minor')
+        filter_column = urwid.Columns(
+            [
+                ('pack', urwid.Text(self.config["greeting_line"])),
+                self.path_filter,
+                (self.search_engine_label_limit, self.search_engine_label)
+            ])
+        self.info_text_header = urwid.Text("")
+        self.header_pile = urwid.Pile([filter_column, urwid.Padding(urwid.AttrWrap(self.info_text_header, 'info'), left=2)])
+        self.view = urwid.AttrWrap(urwid.Frame(self.listbox, header=self.header_pile), 'bg')
+
+        palette = []
+        for name, values in self.config["palette"].items():
+            text, bg = values.split("/")
+            entry = (name, text, bg, 'standout')
+            palette.append(entry)
+
+        # there may be data that user already entered before MainLoop was launched
+        buff = util.get_stdin_buffer(one_line=True)
+        if buff:
+            self.path_filter.set_text(buff)
+            self.update_listbox()
+            # TODO This is temporary fix, it seems to me that cleaning of the list is not really correct
+            # steps to reproduce problem:
+            # - add time.sleep(3) just before get_stdin_buffer()
+            # - launch j
+            # - input nonexistent path
+            # IndexError: No widget at position 0
+            # this is due to cleaning of the ListBox (self.listbox.body.set_entries([])) in update_listbox()
+            # however, such cleaning method of the Listbox works correctly if you enter a nonexistent path during normal run of the program
+            if not self.listbox.body:
+                # replace self.listbox with a new one with empty listwalker
+                self.listbox = urwid.ListBox(PathListWalker(self.corpus.strings, self.states, self.get_page_size()))
+                self.view = urwid.AttrWrap(urwid.Frame(self.listbox, header=self.header_pile), 'bg')
+
+        loop = urwid.MainLoop(self.view, palette, unhandled_input=self.input_handler, handle_mouse=False, pop_ups=True)
+        self.search_worker = SearchWorker(loop, self.on_search_done, self.on_search_error)
+        stages.finish("widgets")
+        self.hook_first_draw(loop)
+        try:
+            loop.run()
+        finally:
+            self.prefetcher.stop()
+            self.listing_cache.save()
+
+    def hook_first_draw(self, loop):
+        # time from the start of the main loop (screen setup included) to the end of the first draw is traced,
+        # prefetching starts when the list is shown
+        draw_screen = loop.draw_screen
+
+        def first_draw_screen(*args, **kwargs):
+            loop.draw_screen = draw_screen
+            draw_screen(*args, **kwargs)
+            stages.finish("first draw")
+            self.prefetch_history()
+
+        loop.draw_screen = first_draw_screen
+        stages.start("first draw")
+
+    def prefetch_history(self):
+        # the most recent directories are likely to be completed
+        count = min(self.config["prefetch_history_size"], self.history_size)
+        paths = [expanduser(path) for path, exists in zip(self.corpus.strings[:count], self.states) if exists]
+        self.prefetcher.prefetch(paths)
+
+    def prefetch_filter_path(self):
+        # subdirectories of the entered directory are likely to be completed next
+        path = self.path_filter.get_text()
+        if "/" not in path:
+            return
+        path = expanduser(path.rsplit("/", 1)[0] or "/")
+        if os.path.isabs(path) and path != self.prefetched_filter_path:
+            self.prefetched_filter_path = path
+            self.prefetcher.prefetch([path], with_children=True)
+
+    def get_selected_path(self):
+        if not self.selected_path:
+            return ""
+        return util.replace_home_with_tilde(self.selected_path)
+
+    def get_stored_paths(self):
+        cwd = util.replace_home_with_tilde(util.get_cwd())
+        cwd = path_strip(cwd)
+        oldpwd = util.replace_home_with_tilde(os.environ.get("OLDPWD", cwd))
+        oldpwd = path_strip(oldpwd)
+
+        with stages.stage("read history"):
+            entries = read_path_list(self.config["history_file"])
+
+        check_existence = self.config["check_directory_existence"]
+        # this may take a while - print something
+        # there may be network paths or meta info might be not in the system cache
+        if check_existence:
+            util.print_status("Checking the existence of directories...", truncate=True)
+
+        skip_set = ('', cwd, oldpwd)
+        # cwd always first, prev path in the current shell is always second if available
+        paths = [cwd]
+        if cwd != oldpwd:
+            paths.append(oldpwd)
+        for line in entries:
+            path = line.strip()
+            if path in skip_set:
+                continue
+            paths.append(path_strip(path))
+
+        if check_existence:
+            stages.start("existence check")
+            cache = ExistenceCache(get_existence_cache_filename(self.config), self.config["existence_cache_ttl"])
+            cache.load()
+            states = probe.check_existence(self.existence_checker, cache, [expanduser(path) for path in paths])
+            cache.save()
+            stages.finish("existence check")
+            util.remove_status()
+        else:
+            states = [True] * len(paths)
+            # cwd and oldpwd are checked anyway
+            for index in range(2 if cwd != oldpwd else 1):
+                states[index] = os.path.exists(expanduser(paths[index]))
+        return paths, states
+
+    def get_indexed_paths(self, history_paths):
+        # existence of the indexed directories is not checked
+        filename = indexer.get_index_filename(self.config)
+        if not os.path.exists(filename):
+            return []
+        with stages.stage("read index"):
+            known = set(history_paths)
+            return [path for path in indexer.read_index_paths(filename) if path not in known]
+
+    def is_shortcut(self, input):
+        if not self.shortcuts_cache:
+            for x in self.shortcuts.values():
+                self.shortcuts_cache.update(x)
+        return input in self.shortcuts_cache
+
+    def input_handler(self, input):
+        if not isinstance(input, str):
+            return input
+
+        if input in self.focus_shortcuts:
+            self.complete_search()
+
+        if input in self.shortcuts["exit"]:
+            if self.path_filter.is_popup_opened():
+                self.path_filter.close_popup()
+            else:
+                raise urwid.ExitMainLoop()
+
+        if input in self.shortcuts["cd_selected_path"]:
+            if self.path_filter.is_popup_opened():
+                selected = self.path_filter.popup.get_selected()
+                dirname = os.path.dirname(self.path_filter.get_text())
+                path = os.path.join(dirname, selected.get_path()) + "/"
+
+                self.path_filter.set_text(path)
+                self.path_filter.close_popup()
+            else:
+                selected = self.listbox.get_focus()[0]
+                if selected:
+                    path = selected.get_path()
+                else:
+                    path = self.path_filter.get_text()
+                self.change_directory(path)
+                return
+
+        if input in self.shortcuts["cd_entered_path"]:
+            self.change_directory(self.path_filter.get_text())
+            return
+
+        if input in self.shortcuts["copy_selected_path_to_clipboard"]:
+            selected = self.listbox.get_focus()[0]
+            if selected:
+                util.copy_to_clipboard(selected.get_path())
+                if self.config["exit_after_coping_path"]:
+                    raise urwid.ExitMainLoop()
+                return
+
+        if input in self.shortcuts["autocomplete"]:
+            path = self.path_filter.get_text()
+            if not path.startswith("~") and not path.startswith("/"):
+                path = self.extend_path_filter_text() or path
+            # TODO ??? hack
+            if path == "~":
+                path = path_strip(path)
+                self.path_filter.set_text(path)
+            self.path_filter.autocomplete()
+
+        # rename shortcut name
+        if input in self.shortcuts["paste_selected_path"]:
+            self.extend_path_filter_text()
+
+        if input in self.shortcuts["remove_word"]:
+            path = self.path_filter.get_text()
+            path = path_strip(path)
+            if "/" in path:
+                path, _ = path.rsplit("/", 1)
+                if path:
+                    path += "/"
+                self.path_filter.set_text(path)
+            else:
+                self.path_filter.set_text("")
+
+        if input in self.shortcuts["case_sensitive"]:
+            self.case_sensitive = not self.case_sensitive
+            self.update_search_engine_label()
+
+        if input in self.shortcuts["fuzzy_search"]:
+            self.fuzzy_search = not self.fuzzy_search
+            self.update_search_engine_label()
+
+        if input in self.shortcuts["search_pos"]:
+            self.search_from_any_pos = not self.search_from_any_pos
+            self.update_search_engine_label()
+
+        if input in self.shortcuts["inc_search_offset"]:
+            self.search_offset += 1
+
+        if input in self.shortcuts["dec_search_offset"]:
+            self.search_offset -= 1
+            if self.search_offset < 0:
+                self.search_offset = 0
+
+        if input in self.shortcuts["cd_to_shortcut_path"]:
+            path = get_shortcut_path(self.shortcuts_paths_filename, self.shortcuts["cd_to_shortcut_path"].index(input))
+            if path:
+                if self.config["exit_after_pressing_path_shortcut"]:
+                    self.selected_path = path
+                    raise urwid.ExitMainLoop()
+                else:
+                    path = util.replace_home_with_tilde(path)
+                    if self.config["append_asterisk_after_pressing_path_shortcut"]:
+                        path += "*"
+                    self.path_filter.set_text(path)
+            else:
+                # do nothing
+                return
+
+        if input in self.shortcuts["store_shortcut_path"]:
+            selected = self.listbox.get_focus()[0]
+            if selected:
+                selected_path = expanduser(selected.get_path())
+                store_shortcut_path(self.shortcuts_paths_filename, selected_path, self.shortcuts["store_shortcut_path"].index(input))
+            return
+
+        # clean up header
+        self.info_text_header.set_text("")
+
+        if input in self.shortcuts["clean_input"]:
+            self.path_filter.set_text("")
+            return
+
+        # display input if it is not a shortcut
+        if not self.is_shortcut(input):
+            self.path_filter.keypress((20,), input)
+            # Remove offset if there is no output
+            if not self.path_filter.get_text():
+                self.search_offset = 0
+
+        self.prefetch_filter_path()
+
+        # update popup content
+        if self.path_filter.is_popup_opened():
+            path = self.path_filter.get_text()
+            path, dirs, prefix = self.path_filter.parse_path(path)
+            if dirs:
+                self.path_filter.popup.update(dirs, prefix)
+            else:
+                self.path_filter.close_popup()
+
+        # don't re-render listbox extra time
+        if input not in ["up", "down", "left", "right"]:
+            self.update_listbox()
+
+    def change_directory(self, path):
+        path = expanduser(path).rstrip(" ")
+        # double Enter should return nearest path
+        if path == self.previously_selected_nonexistent_path:
+            path = util.get_nearest_existing_dir(path)
+        elif os.path.islink(path):
+            path = os.readlink(path)
+            if not os.path.exists(path):
+                self.previously_selected_nonexistent_path = path
+                self.info_text_header.set_text("Link refers to the not existing directory: '%s'" % path)
+                return
+        elif os.path.isfile(path):
+            path = os.path.dirname(path)
+        elif not os.path.exists(path):
+            self.previously_selected_nonexistent_path = path
+            self.info_text_header.set_text("No such directory: '%s'" % path)
+            return
+        self.selected_path = path
+        raise urwid.ExitMainLoop()
+
+    def extend_path_filter_text(self):
+        selected = self.listbox.get_focus()[0]
+        if selected:
+            if isinstance(selected.path, tuple):
+                path = selected.path[0] + selected.path[1]
+            else:
+                path = selected.path
+            # remove / to prevent popup appearance
+            # when autocompletion called for first time
+            if path_strip(path) == path_strip(self.path_filter.get_text()):
+                path = selected.get_path()
+            else:
+                path = path_strip(path)
+            self.path_filter.set_text(path)
+            return path
+
+    def update_search_engine_label(self):
+        self.search_engine_label.set_text(self.get_search_engine_label_text())
+
+    def get_search_engine_label_text(self):
+        parts = []
+        if self.fuzzy_search:
+            parts.append("fuzzy")
+        else:
+            parts.append("direct")
+
+        if self.search_from_any_pos:
+            parts.append("any pos")
+        else:
+            parts.append("/headed")
+
+        if self.case_sensitive:
+            parts.append("CS")
+        else:
+            parts.append("CIS")
+
+        return "[%s]" % " ".join(parts)[:self.search_engine_label_limit - 2]
+
+    def get_search_engine(self, pattern):
+        if not self.fuzzy_search:
+            return search.get_engine(search.RegexSearchEngine, pattern, self.case_sensitive)
+        if self.config["fuzzy_search_engine"] == "bitap":
+            return search.get_engine(
+                search.BitapSearchEngine,
+                pattern,
+                self.case_sensitive,
+                max_errors=self.config["fuzzy_search_max_errors"],
+                minimal_fuzzy_pattern_len=self.config["min_fuzzy_search_len"],
+                narrowing_parts=["/"])
+        return search.get_engine(
+            search.FuzzySearchEngine,
+            pattern,
+            self.case_sensitive,
+            minimal_fuzzy_pattern_len=self.config["min_fuzzy_search_len"],
+            narrowing_parts=["/"])
+
+    def get_search_candidates(self, engine, search_key):
+        # the previous result set can be narrowed instead of full rescan, if the pattern was just extended
+        if self.last_search and not self.search_offset and self.last_search[1:] == search_key[1:]:
+            if engine.narrows(self.last_engine):
+                return self.last_stream.get_narrowing_candidates()
+        # all stored paths
+        return None
+
+    def get_page_size(self):
+        # visible rows and the scroll margin
+        return shutil.get_terminal_size().lines + self.config["search_scroll_margin"]
+
+    def update_listbox(self, background=True):
+        '''
+        Filters the list with the entered path.
+        Matches are searched only for the first page, the rest is searched on scroll.
+        Search runs in the background if the main loop is running, the list is updated when it's done.
+        '''
+        # results of the pending search are not needed anymore
+        if self.search_worker:
+            self.search_worker.cancel()
+        input_path = self.path_filter.get_text()
+        # filter list
+        if input_path:
+            if not self.search_from_any_pos and not input_path.startswith("/") and not input_path.startswith("~"):
+                input_path = "/" + input_path
+
+            search_key = (input_path, self.fuzzy_search, self.search_from_any_pos, self.case_sensitive, self.search_offset)
+            # results are cached to make backspace and toggles responsive
+            engine = self.get_search_engine(input_path)
+            stream = self.search_cache.get(search_key)
+            if stream is None:
+                stream = search.MatchStream(engine, self.corpus, self.get_search_candidates(engine, search_key), self.search_offset)
+                if background and self.search_worker:
+                    self.search_worker.submit(stream, self.get_page_size(), (search_key, engine))
+                    return
+                self.search_cache.put(search_key, stream)
+            stream.fetch(self.get_page_size())
+            self.show_matches(stream, search_key, engine, background)
+        else:
+            self.last_search = None
+            self.listbox.body.set_entries(self.get_all_entries())
+            if self.history_size:
+                self.listbox.set_focus(0)
+
+    def on_search_done(self, stream, payload):
+        search_key, engine = payload
+        self.search_cache.put(search_key, stream)
+        self.show_matches(stream, search_key, engine)
+
+    def on_search_error(self, error, payload):
+        # nothing is matched by the failed search, the next input is searched as usual
+        self.last_search = None
+        self.listbox.body.set_entries([])
+
+    def complete_search(self):
+        # wait for the list to be updated before using the selected path
+        if self.search_worker and self.search_worker.is_pending():
+            self.update_listbox(background=False)
+
+    def show_matches(self, stream, search_key, engine, background=True):
+        if self.search_offset and not stream.matches:
+            self.search_offset -= 1
+            return self.update_listbox(background)
+        self.last_search = search_key
+        self.last_engine = engine
+        self.last_stream = stream
+        self.listbox.body.page_size = self.get_page_size()
+        self.listbox.body.set_stream(stream)
+        if stream.matches:
+            self.listbox.set_focus(0)
+
+    def get_all_entries(self):
+        return [(index, None, self.states[index]) for index in range(self.history_size)]
+
+
+def run(config):
+    urwid.set_encoding("UTF-8")
+    display = Display(config)
+    display.run()
+    return display.get_selected_path()
@@ -0,0 +1,35 @@
+#!/usr/bin/env fish
+
+set -g FASTCDDIR (dirname (realpath (status --current-filename)))
+set -g FASTCDCONFDIR "$HOME/.local/share/fastcd"
+
+# Set hook to track visited dirs, it's called on directory change only
+function _fastcd_hook --on-variable PWD
+    # pass path to the history daemon if it's running, otherwise store it with the jumper
+    sh -c '
+        socket="${XDG_RUNTIME_DIR:-/tmp/fastcd-$(id -u)}/fastcd.sock"
+        if [ -S "$socket" ] && python3 -S -E "$1/client.py" "$3" 2>/dev/null
+        then
+            exit 0
+        fi
+        python3 "$1/jumper.py" --add-path "$3" 2>>"$2/errors.log" 1>&2
+    ' _fastcd_hook "$FASTCDDIR" "$FASTCDCONFDIR" "$PWD" &>/dev/null &
+    disown 2>/dev/null
+end
+
+# directory of the new shell
+_fastcd_hook
+
+function fastcd
+    set -l pathfile "/tmp/fastcd.$fish_pid."(date +%s)".path"
+    python3 "$FASTCDDIR/jumper.py" -o $pathfile $argv
+    # the directory is chosen without arguments, --stages only traces the startup
+    if test $status -eq 0; and begin; test (count $argv) -eq 0; or test "$argv" = "--stages"; end
+        set -l outputpath (cat $pathfile)
+        if test -n "$outputpath"
+            # tilde isn't expanded in variables
+            cd (string replace -r -- '^~' $HOME $outputpath)
+        end
+    end
+    rm -f $pathfile
+end
@@ -2,11 +2,25 @@
 
 FASTCDDIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
 JUMPERTOOL="$FASTCDDIR/jumper.py"
+CLIENTTOOL="$FASTCDDIR/client.py"
 FASTCDCONFDIR="$HOME/.local/share/fastcd"
 
 # Set hook to track visited dirs
 function _fastcd_hook() {
-    (python3 $JUMPERTOOL --add-path "$(pwd)" 2>>${FASTCDCONFDIR}/errors.log 1>&2 &) &>/dev/null
+    # bash has no directory change hook - skip prompts in the same directory
+    if [[ "$PWD" == "$_FASTCD_LAST_PWD" ]]
+    then
+        return
+    fi
+    _FASTCD_LAST_PWD="$PWD"
+    # pass path to the history daemon if it's running, otherwise store it with the jumper
+    local socket="${XDG_RUNTIME_DIR:-/tmp/fastcd-$UID}/fastcd.sock"
+    if [[ -S "$socket" ]]
+    then
+        (python3 -S -E $CLIENTTOOL "$(pwd)" 2>/dev/null || python3 $JUMPERTOOL --add-path "$(pwd)" 2>>${FASTCDCONFDIR}/errors.log 1>&2 &) &>/dev/null
+    else
+        (python3 $JUMPERTOOL --add-path "$(pwd)" 2>>${FASTCDCONFDIR}/errors.log 1>&2 &) &>/dev/null
+    fi
 }
 
 case $PROMPT_COMMAND in
@@ -20,14 +34,15 @@ esac
 function fastcd {
     PATHFILE="/tmp/fastcd.$$.`date +%s`.path"
     python3 $JUMPERTOOL --escape-special-symbols -o $PATHFILE $@
-    if [[ $? -eq 0 ]] && [[ $# -eq 0 ]]
+    # the directory is chosen without arguments, --stages only traces the startup
+    if [[ $? -eq 0 ]] && [[ $# -eq 0 || "$*" == "--stages" ]]
     then
         OUTPUTPATH=`cat $PATHFILE`
-        rm $PATHFILE
         if [[ ! -z "$OUTPUTPATH" ]]
         then
             # Eval is required to interpret ~
             eval cd $OUTPUTPATH
         fi
     fi
+    rm -f $PATHFILE
 }
@@ -0,0 +1,214 @@
+# coding: utf-8
+
+'''
+Local directory indexer ('fastcd --index ROOT...').
+Indexed directories are searchable in the jumper below the history, so never visited paths
+don't have to be completed level by level.
+
+Index is a text file with sorted front-coded records:
+    '#root<TAB>path', '#skip<TAB>pattern' and '#depth<TAB>max depth' - parameters of the index
+    '#time<TAB>index time' - time of the update
+    'common prefix length with the previous path<TAB>mtime (ns)<TAB>rest of the path'
+Update re-lists only directories whose mtime changed, subdirectories of the rest are taken from the index.
+Directories which subdirectories are not in the index (depth limit, failed listing of the directory
+or of its subdirectory) are stored with UNLISTED mtime, so they are listed on the next update.
+'''
+
+import os
+import time
+import queue
+import threading
+import collections
+
+try:
+    from fastcd import core, util
+except ImportError:
+    from . import core, util
+
+
+INDEX_NAME = "index.txt"
+# mtime of the directory which listing can't be reused
+UNLISTED = -1
+
+
+def get_index_filename(config):
+    return os.path.join(os.path.dirname(config["history_file"]), INDEX_NAME)
+
+
+class DirectoryIndex(object):
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.roots = []
+        self.skip_list = []
+        self.max_depth = None
+        self.time = 0
+        # path -> mtime
+        self.entries = {}
+
+    def load(self):
+        path = ""
+        for line in core.read_lines(self.filename):
+            if line.startswith("#"):
+                fields = line.split("\t", 1)
+                if len(fields) != 2:
+                    continue
+                name, value = fields
+                if name == "#root":
+                    self.roots.append(value)
+                elif name == "#skip":
+                    self.skip_list.append(value)
+                elif name == "#depth":
+                    self.max_depth = int(value)
+                elif name == "#time":
+                    self.time = float(value)
+                continue
+            fields = line.split("\t", 2)
+            if len(fields) != 3:
+                continue
+            shared, mtime, rest = fields
+            path = path[:int(shared)] + rest
+            self.entries[path] = int(mtime)
+        return self
+
+    def save(self):
+        lines = ["#root\t{}".format(root) for root in self.roots]
+        lines += ["#skip\t{}".format(pattern) for pattern in self.skip_list]
+        if self.max_depth is not None:
+            lines.append("#depth\t{}".format(self.max_depth))
+        lines.append("#time\t{}".format(self.time))
+        previous = ""
+        for path in sorted(self.entries):
+            if "\n" in path:
+                continue
+            shared = len(os.path.commonprefix([previous, path]))
+            lines.append("{}\t{}\t{}".format(shared, self.entries[path], path[shared:]))
+            previous = path
+        util.write_file_atomically(self.filename, "\n".join(lines) + "\n")
+
+    def get_children(self):
+        children = collections.defaultdict(list)
+        for path in self.entries:
+            children[os.path.dirname(path)].append(path)
+        return children
+
+
+def list_dirs(path):
+    # symlinks are not followed to avoid loops and duplicates
+    if not hasattr(os, "scandir"):
+        # python 3.4
+        paths = [os.path.join(path, name) for name in os.listdir(path)]
+        return [path for path in paths if os.path.isdir(path) and not os.path.islink(path)]
+    dirs = []
+    for entry in os.scandir(path):
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                dirs.append(entry.path)
+        except OSError:
+            pass
+    return dirs
+
+
+class Indexer(object):
+    '''
+    Walks the roots with parallel scandir workers.
+    Directories matching skip_list (with their subdirectories) are not indexed.
+    '''
+
+    def __init__(self, index, skip_list, max_depth, threads=8):
+        self.index = index
+        self.skip_list = skip_list
+        # invalid patterns must fail here, not in the workers
+        self.skip_matcher = core.compile_skip_list(skip_list)
+        self.max_depth = max_depth
+        self.threads = max(threads, 1)
+        self.listed = 0
+        self.reused = 0
+
+    def update(self, roots):
+        old_entries = self.index.entries
+        reusable = self.index.skip_list == self.skip_list and self.index.max_depth == self.max_depth
+        children = self.index.get_children() if reusable else {}
+        # time of the previous indexing - listings are reused if they were made long after modification
+        indexed = self.index.time
+        started = time.time()
+        entries = {}
+        lock = threading.Lock()
+        tasks = queue.Queue()
+
+        def process(path, depth, parent):
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                if parent is not None:
+                    # the reused listing of the parent would skip the path forever
+                    with lock:
+                        entries[parent] = UNLISTED
+                return
+            if depth >= self.max_depth:
+                with lock:
+                    entries[path] = UNLISTED
+                return
+            old_mtime = old_entries.get(path)
+            if reusable and old_mtime == mtime and not util.is_racy(mtime, indexed):
+                subdirs = children.get(path, [])
+                with lock:
+                    self.reused += 1
+            else:
+                try:
+                    subdirs = [subdir for subdir in list_dirs(path) if not self.skip_matcher.match(subdir)]
+                except OSError:
+                    subdirs = []
+                    mtime = UNLISTED
+                with lock:
+                    self.listed += 1
+            with lock:
+                entries[path] = mtime
+            for subdir in subdirs:
+                tasks.put((subdir, depth + 1, path))
+
+        def worker():
+            while True:
+                path, depth, parent = tasks.get()
+                try:
+                    process(path, depth, parent)
+                finally:
+                    tasks.task_done()
+
+        for root in roots:
+            tasks.put((root, 0, None))
+        for _ in range(self.threads):
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+        tasks.join()
+
+        self.index.roots = list(roots)
+        self.index.skip_list = list(self.skip_list)
+        self.index.max_depth = self.max_depth
+        self.index.time = started
+        self.index.entries = entries
+        return entries
+
+
+def read_index_paths(filename):
+    # returns indexed paths with home replaced by tilde, upper directories first
+    index = DirectoryIndex(filename).load()
+    paths = sorted(index.entries, key=lambda path: (path.count("/"), path))
+    return [util.replace_home_with_tilde(path) for path in paths]
+
+
+def run(config, roots):
+    index = DirectoryIndex(get_index_filename(config)).load()
+    # roots are replaced if specified
+    roots = [os.path.abspath(os.path.expanduser(root)) for root in roots] or index.roots
+    if not roots:
+        print("Specify directories to index: 'fastcd --index ROOT...'")
+        return
+    skip_list = config["skip_list"] + config["index_skip_list"]
+    indexer = Indexer(index, skip_list, config["index_max_depth"], config["index_threads"])
+    started = time.time()
+    indexer.update(roots)
+    index.save()
+    print("Indexed {} directories in {:.2f}s ({} listed, {} unchanged)".format(
+        len(index.entries), time.time() - started, indexer.listed, indexer.reused))
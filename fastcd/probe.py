@@ -0,0 +1,342 @@
+# coding: utf-8
+
+import os
+import re
+import time
+import threading
+import collections
+
+try:
+    from fastcd import util
+except ImportError:
+    from . import util
+
+
+# existence states
+EXISTS = True
+MISSING = False
+# probe timed out or mount point is not available
+UNKNOWN = None
+# mtime of the missing directory
+MISSING_MTIME = -1
+
+
+def unescape_mount_point(path):
+    # spaces and other special symbols are octal escaped in /proc/mounts
+    return re.sub(r"\\([0-7]{3})", lambda match: chr(int(match.group(1), 8)), path)
+
+
+# file system types (fuse.* subtypes as well) of remote mounts
+NETWORK_FILESYSTEMS = {"nfs", "nfs4", "cifs", "smbfs", "smb3", "ncpfs", "afs", "9p", "ceph", "glusterfs", "lustre", "sshfs", "davfs", "rclone", "s3fs"}
+
+
+def is_network_filesystem(fstype):
+    if fstype.startswith("fuse."):
+        fstype = fstype[len("fuse."):]
+    return fstype in NETWORK_FILESYSTEMS
+
+
+def get_mount_points(filename="/proc/self/mounts"):
+    '''
+    Returns list of (mount point, file system type).
+    '''
+    try:
+        with open(filename) as afile:
+            lines = afile.read().split("\n")
+    except (IOError, OSError):
+        return []
+    mount_points = {}
+    for line in lines:
+        fields = line.split(" ")
+        if len(fields) > 2:
+            # the last mount hides the previous ones
+            mount_points[unescape_mount_point(fields[1])] = fields[2]
+    # the longest mount point will be matched first
+    return sorted(mount_points.items(), key=lambda item: len(item[0]), reverse=True)
+
+
+class ExistenceChecker(object):
+    '''
+    Checks existence of paths in parallel without blocking on hung network mounts.
+    Probe of every path is limited by path_timeout and all probes on the same network mount
+    are limited by mount_timeout (seconds), so slow local disks are checked till the end.
+    Timed out paths get UNKNOWN state.
+    Mount point is skipped for the rest of the session if its deadline is exceeded
+    or its probes timed out mount_timeouts_limit times.
+    Probes run in daemon threads, so hung stat() call doesn't prevent the program from exiting.
+    '''
+
+    def __init__(self, threads=16, path_timeout=0.5, mount_timeout=3.0, mount_timeouts_limit=2):
+        self.threads = max(threads, 1)
+        self.path_timeout = path_timeout
+        self.mount_timeout = mount_timeout
+        self.mount_timeouts_limit = mount_timeouts_limit
+        mount_points = get_mount_points()
+        self.mount_points = [mount_point for mount_point, _ in mount_points]
+        self.network_mounts = set(mount_point for mount_point, fstype in mount_points if is_network_filesystem(fstype))
+        self.parent_mounts = {}
+        self.mount_timeouts = collections.defaultdict(int)
+        self.dead_mounts = set()
+
+    def find_mount_point(self, path):
+        for mount_point in self.mount_points:
+            if path == mount_point or path.startswith(mount_point.rstrip("/") + "/"):
+                return mount_point
+        # there is no mount table (MacOs) - group paths by top level directories
+        return "/".join(path.split("/")[:3])
+
+    def get_mount_point(self, path):
+        if not self.mount_points or path in self.mount_points:
+            return self.find_mount_point(path)
+        # paths share parents - mount point of the parent is cached for the session
+        parent = path[:path.rfind("/")] or "/"
+        mount_point = self.parent_mounts.get(parent)
+        if mount_point is None:
+            mount_point = self.parent_mounts[parent] = self.find_mount_point(parent)
+        return mount_point
+
+    def is_available(self, path):
+        return self.get_mount_point(path) not in self.dead_mounts
+
+    def register_timeout(self, mount_point):
+        self.mount_timeouts[mount_point] += 1
+        if self.mount_timeouts[mount_point] >= self.mount_timeouts_limit:
+            self.dead_mounts.add(mount_point)
+
+    def check(self, paths, probe=os.path.exists, batch_size=64):
+        '''
+        Returns list of states for the specified absolute paths.
+        '''
+        if not paths:
+            return []
+        mounts = [self.get_mount_point(path) for path in paths]
+        results = [UNKNOWN] * len(paths)
+        finished = [False] * len(paths)
+        queue = collections.deque(range(len(paths)))
+        batch_size = max(min(batch_size, len(paths) // self.threads), 1)
+        # batch - taken paths, probe - (index, start time) of the running probe,
+        # the worker updates the probe without the lock, so the main thread doesn't wake up per path
+        jobs = []
+        mount_started = {}
+        cond = threading.Condition()
+        state = {"remaining": len(paths)}
+
+        def get_deadline(index, started):
+            deadline = started + self.path_timeout
+            if mounts[index] in self.network_mounts:
+                deadline = min(deadline, mount_started[mounts[index]] + self.mount_timeout)
+            return deadline
+
+        def finish(index, result):
+            # must be called under the lock
+            if finished[index]:
+                return
+            finished[index] = True
+            results[index] = result
+            state["remaining"] -= 1
+            if not state["remaining"]:
+                cond.notify()
+
+        def take_batch():
+            # must be called under the lock
+            batch = []
+            while queue and len(batch) < batch_size:
+                index = queue.popleft()
+                if mounts[index] in self.dead_mounts:
+                    finish(index, UNKNOWN)
+                else:
+                    batch.append(index)
+            return batch
+
+        def worker():
+            job = {"batch": [], "probe": None, "abandoned": False}
+            done = []
+            expired = set()
+            with cond:
+                jobs.append(job)
+            while True:
+                with cond:
+                    # results of the batch are published at once
+                    self.dead_mounts.update(expired)
+                    for index, result in done:
+                        finish(index, result)
+                    if job["abandoned"]:
+                        return
+                    job["batch"] = take_batch()
+                    if not job["batch"]:
+                        jobs.remove(job)
+                        return
+                done = []
+                for index in job["batch"]:
+                    mount = mounts[index]
+                    now = time.time()
+                    if mount in self.network_mounts and now - mount_started.setdefault(mount, now) >= self.mount_timeout:
+                        expired.add(mount)
+                        done.append((index, UNKNOWN))
+                        continue
+                    job["probe"] = (index, now)
+                    try:
+                        result = probe(paths[index])
+                    except Exception:
+                        result = UNKNOWN
+                    job["probe"] = None
+                    # the rest of the batch is passed to another worker by timeout
+                    if job["abandoned"]:
+                        break
+                    done.append((index, result))
+
+        def spawn_worker():
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+
+        for _ in range(min(self.threads, len(paths))):
+            spawn_worker()
+
+        # probes started after the check can't expire earlier
+        check_interval = self.path_timeout
+        if self.network_mounts:
+            check_interval = min(check_interval, self.mount_timeout)
+        with cond:
+            while state["remaining"]:
+                now = time.time()
+                deadline = now + check_interval
+                for job in list(jobs):
+                    running = job["probe"]
+                    if running is None:
+                        continue
+                    index, started = running
+                    index_deadline = get_deadline(index, started)
+                    if now >= index_deadline:
+                        # abandon hung probe and replace its worker
+                        job["abandoned"] = True
+                        jobs.remove(job)
+                        finish(index, UNKNOWN)
+                        queue.extendleft(reversed([i for i in job["batch"] if not finished[i]]))
+                        mount = mounts[index]
+                        self.register_timeout(mount)
+                        if mount in self.network_mounts and now - mount_started[mount] >= self.mount_timeout:
+                            self.dead_mounts.add(mount)
+                        spawn_worker()
+                    else:
+                        deadline = min(deadline, index_deadline)
+                if state["remaining"]:
+                    cond.wait(deadline - now)
+        return results
+
+
+def get_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except (FileNotFoundError, NotADirectoryError):
+        return MISSING_MTIME
+
+
+def check_existence(checker, cache, paths):
+    '''
+    Fresh cached results are used as is. Stale ones are revalidated by parent directory mtime
+    (parent stats are shared between siblings), only paths with changed parents are probed.
+    '''
+    now = time.time()
+    results = [UNKNOWN] * len(paths)
+    stale = []
+    for index, path in enumerate(paths):
+        entry = cache.get(path)
+        if entry and cache.is_fresh(entry, now):
+            results[index] = entry[0]
+        else:
+            stale.append(index)
+
+    parents = sorted(set(os.path.dirname(paths[index]) for index in stale))
+    parent_mtimes = dict(zip(parents, checker.check(parents, probe=get_mtime)))
+
+    to_probe = []
+    for index in stale:
+        path = paths[index]
+        entry = cache.get(path)
+        parent_mtime = parent_mtimes[os.path.dirname(path)]
+        if parent_mtime is UNKNOWN:
+            continue
+        if parent_mtime == MISSING_MTIME:
+            results[index] = MISSING
+            cache.update(path, MISSING, parent_mtime, now)
+        elif entry and entry[2] == parent_mtime and not util.is_racy(parent_mtime, entry[1]):
+            results[index] = entry[0]
+            cache.update(path, entry[0], parent_mtime, now)
+        else:
+            to_probe.append(index)
+
+    states = checker.check([paths[index] for index in to_probe])
+    for index, state in zip(to_probe, states):
+        results[index] = state
+        if state is not UNKNOWN:
+            cache.update(paths[index], state, parent_mtimes[os.path.dirname(paths[index])], now)
+    # forget paths removed from the history
+    cache.retain(paths)
+    return results
+
+
+class ListingPrefetcher(object):
+    '''
+    Warms the listing cache (see core.ListingCache) in the background, so the autocompletion
+    is answered from memory. Listing of the directory may be requested together with listings
+    of its subdirectories (children_limit of them at most).
+    Recent requests are processed first. Number of threads is bounded,
+    stop() drops the queue and abandons running listings (threads are daemons).
+    '''
+
+    def __init__(self, cache, threads=2, children_limit=50, queue_limit=1000):
+        self.cache = cache
+        self.threads = max(threads, 1)
+        self.children_limit = children_limit
+        self.queue_limit = queue_limit
+        self.cond = threading.Condition()
+        # (path, with children)
+        self.queue = collections.deque()
+        self.queued = set()
+        self.workers = 0
+        self.stopped = False
+
+    def prefetch(self, paths, with_children=False):
+        with self.cond:
+            if self.stopped:
+                return
+            # requests are taken from the left, keep the order of paths
+            for path in reversed(paths):
+                task = (path, with_children)
+                if task in self.queued:
+                    self.queue.remove(task)
+                self.queue.appendleft(task)
+                self.queued.add(task)
+            # the oldest requests are dropped
+            while len(self.queue) > self.queue_limit:
+                self.queued.discard(self.queue.pop())
+            while self.workers < min(self.threads, len(self.queue)):
+                self.workers += 1
+                thread = threading.Thread(target=self.worker)
+                thread.daemon = True
+                thread.start()
+            self.cond.notify_all()
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.queue.clear()
+            self.queued.clear()
+            self.cond.notify_all()
+
+    def worker(self):
+        while True:
+            with self.cond:
+                if self.stopped or not self.queue:
+                    self.workers -= 1
+                    return
+                task = self.queue.popleft()
+                self.queued.discard(task)
+            path, with_children = task
+            try:
+                dirs = self.cache.get_dirs(path)
+            except Exception:
+                continue
+            if with_children and dirs:
+                self.prefetch([os.path.join(path, name) for name in dirs[:self.children_limit]])
@@ -1,6 +1,112 @@
 # coding: utf-8
 
 import re
+import array
+import bisect
+import threading
+import collections
+
+
+def fold_char(char):
+    folded = char.casefold()
+    if len(folded) == 1:
+        return folded
+    lowered = char.lower()
+    if len(lowered) == 1:
+        return lowered
+    return char
+
+
+def fold_case(string):
+    '''
+    Unicode case folding that never changes the length of the string,
+    so match spans found in the folded string are valid for the original one.
+    Characters that are folded into several ones (e.g. 'ß' -> 'ss') are lowercased instead.
+    '''
+    folded = string.casefold()
+    # every character is folded into at least one character
+    if len(folded) == len(string):
+        return folded
+    return "".join([fold_char(char) for char in string])
+
+
+class Lines(object):
+    '''
+    Read-only sequence of the lines of the buffer (see Corpus), strings are sliced on demand.
+    '''
+
+    def __init__(self, buffer, offsets):
+        self.buffer = buffer
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self.offsets)))]
+        if index < 0:
+            index += len(self.offsets)
+        start = self.offsets[index]
+        # the last line isn't followed by the newline
+        end = self.offsets[index + 1] - 1 if index + 1 < len(self.offsets) else len(self.buffer)
+        return self.buffer[start:end]
+
+    def __iter__(self):
+        if not self.offsets:
+            return iter([])
+        return iter(self.buffer.split("\n"))
+
+    def get_range(self, first, last):
+        # lines of the continuous part are split at once, it's faster than slicing them one by one
+        if first >= last:
+            return []
+        end = self.offsets[last] - 1 if last < len(self.offsets) else len(self.buffer)
+        return self.buffer[self.offsets[first]:end].split("\n")
+
+
+class Corpus(object):
+    '''
+    Strings to search in with their case folded forms, which are computed once.
+    Strings are stored compactly - joined into a single buffer with an array of line offsets,
+    per string objects are created only when they are requested. Folding doesn't change the length,
+    so the folded buffer shares the offsets (and the buffer itself if the strings are already folded).
+    Strings must not contain newlines.
+    '''
+
+    # number of strings folded at once
+    fold_block_size = 4096
+
+    def __init__(self, strings):
+        strings = list(strings)
+        self.buffer = "\n".join(strings)
+        self.offsets = array.array("I" if len(self.buffer) < 2 ** 32 else "Q")
+        pos = 0
+        for string in strings:
+            self.offsets.append(pos)
+            pos += len(string) + 1
+        # casefold() allocates several times the size of the string, so the buffer is folded in blocks
+        folded_blocks = []
+        for first in range(0, len(strings), self.fold_block_size):
+            block = strings[first:first + self.fold_block_size]
+            folded = "\n".join(block).casefold()
+            if len(folded) != sum(len(string) for string in block) + len(block) - 1:
+                folded = "\n".join([fold_case(string) for string in block])
+            folded_blocks.append(folded)
+        folded = "\n".join(folded_blocks)
+        del folded_blocks
+        self.folded_buffer = self.buffer if folded == self.buffer else folded
+        self.strings = Lines(self.buffer, self.offsets)
+        self.folded = Lines(self.folded_buffer, self.offsets)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def get_buffer(self, case_sensitive):
+        '''
+        Returns newline-joined strings (or folded strings) and offsets of the lines in the buffer.
+        '''
+        return (self.buffer if case_sensitive else self.folded_buffer, self.offsets)
 
 
 class SearchEngine(object):
@@ -8,23 +114,118 @@ class SearchEngine(object):
     Search engine must support '*' and '$' extra characters, where
      '*' means any number of any character
      '$' means end of the line
+    Case insensitive engines search in the case folded string (see fold_case()),
+    which may be passed precomputed.
     '''
 
+    # number of strings split at once by iter_many()
+    block_size = 1024
+
     def __init__(self, pattern, case_sensitive):
         pass
 
-    def search(self, string, pos):
+    def search(self, string, pos=0, folded=None):
         raise NotImplementedError()
 
-    def finditer(self, string):
+    def narrows(self, previous):
+        '''
+        Returns True if every string matched by this engine is matched by the previous one as well,
+        so only the previous results need to be rescanned.
+        '''
+        return False
+
+    def finditer(self, string, folded=None):
         pos = 0
-        while True:
-            match = self.search(string, pos)
+        while pos <= len(string):
+            match = self.search(string, pos, folded)
             if not match:
                 return
             pos = match.end()
+            # step over empty match
+            if match.start() == pos:
+                pos += 1
             yield match
 
+    def search_many(self, corpus, indices=None, skip=0):
+        '''
+        Searches in the strings of the corpus (all or specified by ascending indices).
+        Returns list of (index, start, end) of the matched strings, where skip matches are skipped in every string.
+        '''
+        return list(self.iter_many(corpus, indices, skip))
+
+    def iter_many(self, corpus, indices=None, skip=0):
+        '''
+        Lazy version of search_many() - matches are yielded in the order of indices.
+        '''
+        strings = corpus.strings
+        folded = corpus.folded
+        if indices is None:
+            indices = range(len(strings))
+        if isinstance(indices, range) and indices.step == 1:
+            # continuous part of the corpus is split in blocks
+            first, last = max(indices.start, 0), min(indices.stop, len(strings))
+            for block_first in range(first, last, self.block_size):
+                block_last = min(block_first + self.block_size, last)
+                # only spans are yielded, so a single form of the strings is enough
+                block = (strings if self.case_sensitive else folded).get_range(block_first, block_last)
+                for index, string in enumerate(block, block_first):
+                    for counter, match in enumerate(self.finditer(string, string)):
+                        if counter >= skip:
+                            yield (index, match.start(), match.end())
+                            break
+            return
+        for index in indices:
+            for counter, match in enumerate(self.finditer(strings[index], folded[index])):
+                if counter >= skip:
+                    yield (index, match.start(), match.end())
+                    break
+
+
+ENGINE_CACHE_SIZE = 128
+_engine_cache = collections.OrderedDict()
+_engine_cache_lock = threading.Lock()
+
+
+def get_engine(engine_class, pattern, case_sensitive=False, **options):
+    '''
+    Returns compiled search engine from the bounded cache, so the automatons are built once per pattern.
+    Engines can be shared between threads: search doesn't change them, except for the locked cache of SymbolClasses.
+    '''
+    key = (engine_class, pattern, case_sensitive, tuple(sorted(
+        (name, tuple(value) if isinstance(value, list) else value) for name, value in options.items())))
+    with _engine_cache_lock:
+        engine = _engine_cache.get(key)
+        if engine is not None:
+            _engine_cache.move_to_end(key)
+            return engine
+    engine = engine_class(pattern, case_sensitive, **options)
+    with _engine_cache_lock:
+        _engine_cache[key] = engine
+        while len(_engine_cache) > ENGINE_CACHE_SIZE:
+            _engine_cache.popitem(last=False)
+    return engine
+
+
+def is_narrowing(previous, pattern, fuzzy=False, minimal_fuzzy_pattern_len=3, narrowing_parts=None):
+    '''
+    Returns True if every string matched by the pattern is matched by the previous pattern as well.
+    It's so, if the pattern is obtained by appending characters to the previous one,
+    except for the case when the fuzzy search turns on for the last part of the pattern
+    as it becomes long enough.
+    '''
+    if not previous or not pattern.startswith(previous):
+        return False
+    if not fuzzy:
+        return True
+    # the rest of the pattern is ignored after '$'
+    if "$" in previous:
+        return True
+    separators = re.compile("|".join(re.escape(s) for s in ["*"] + list(narrowing_parts or [])))
+    tail = separators.split(previous)[-1]
+    head = separators.split(pattern[len(previous):])[0]
+    minimal_fuzzy_pattern_len = max(minimal_fuzzy_pattern_len, 2)
+    return len(tail) >= minimal_fuzzy_pattern_len or len(tail) + len(head) < minimal_fuzzy_pattern_len
+
 
 class MatchObject(object):
     '''
@@ -80,19 +281,140 @@ class RegexSearchEngine(SearchEngine):
             r"\*": ".*?",
             r"\$": r"$",
         }
+        self.original_pattern = pattern
+        self.case_sensitive = case_sensitive
+        if not case_sensitive:
+            pattern = fold_case(pattern)
         pattern = re.escape(pattern)
         for k, v in special_symbols.items():
             pattern = pattern.replace(k, v)
         self.pattern = pattern
-        flags = 0 if case_sensitive else re.IGNORECASE
-        self.regex = re.compile(self.pattern, flags=flags)
+        self.regex = re.compile(self.pattern)
+        # '.' doesn't match newline, so matches never cross lines of the corpus buffer
+        self.buffer_regex = re.compile(self.pattern, re.MULTILINE)
 
-    def search(self, string, pos=0):
-        match = self.regex.search(string, pos=pos)
+    def search(self, string, pos=0, folded=None):
+        if self.case_sensitive:
+            folded = string
+        elif folded is None:
+            folded = fold_case(string)
+        match = self.regex.search(folded, pos=pos)
         if match:
-            return MatchObject(string, self.pattern, match.group(0), match.start(), match.end())
+            start, end = match.span()
+            return MatchObject(string, self.pattern, string[start:end], start, end)
         return None
 
+    def narrows(self, previous):
+        if type(previous) is not type(self) or previous.case_sensitive != self.case_sensitive:
+            return False
+        return is_narrowing(previous.original_pattern, self.original_pattern)
+
+    def iter_many(self, corpus, indices=None, skip=0):
+        # single pass over the corpus buffer is much faster than a search call per string,
+        # unless only a small part of the corpus is requested
+        wanted = None
+        first, last = 0, len(corpus)
+        if isinstance(indices, range) and indices.step == 1:
+            # continuous part of the corpus
+            first, last = max(indices.start, 0), min(indices.stop, len(corpus))
+        elif indices is not None:
+            if len(indices) * 2 < len(corpus):
+                for match in super(RegexSearchEngine, self).iter_many(corpus, indices, skip):
+                    yield match
+                return
+            if len(indices) != len(corpus):
+                wanted = set(indices)
+        if first >= last:
+            return
+        buffer, offsets = corpus.get_buffer(self.case_sensitive)
+        # the last line ends before the newline
+        endpos = offsets[last] - 1 if last < len(offsets) else len(buffer)
+        # line of the previous match and start of the line after it
+        line = first - 1
+        next_offset = offsets[first]
+        empty_match_pos = None
+        for match in self.buffer_regex.finditer(buffer, offsets[first], endpos):
+            start, end = match.span()
+            # finditer() tries non-empty match right after the empty one, search() steps over it (see SearchEngine.finditer)
+            if start == empty_match_pos:
+                continue
+            empty_match_pos = start if start == end else None
+            if start >= next_offset:
+                # matches are often found in the next line, offsets are bisected otherwise
+                line += 1
+                next_offset = offsets[line + 1] if line + 1 < len(offsets) else len(buffer) + 1
+                if start >= next_offset:
+                    line = bisect.bisect_right(offsets, start, line + 1) - 1
+                    next_offset = offsets[line + 1] if line + 1 < len(offsets) else len(buffer) + 1
+                counter = 0
+            if counter == skip and (wanted is None or line in wanted):
+                yield (line, start - offsets[line], end - offsets[line])
+            counter += 1
+
+
+class MatchStream(object):
+    '''
+    Searches in the corpus on demand: matches are found in the order of candidates (history order)
+    until the requested number of them is reached, so the first screen doesn't depend on the corpus size.
+    Candidates are the list of ascending sequences of indices (all strings if None).
+    The search is done in chunks of candidates and can be cancelled between them.
+    '''
+
+    def __init__(self, engine, corpus, candidates=None, skip=0, chunk_size=1000):
+        self.engine = engine
+        self.corpus = corpus
+        self.candidates = [range(len(corpus))] if candidates is None else candidates
+        self.skip = skip
+        self.chunk_size = chunk_size
+        self.matches = []
+        self.exhausted = False
+        # all candidates up to this index are searched
+        self.last_scanned = -1
+        self.chunks = self.iter_chunks()
+        self.chunk = None
+        self.chunk_matches = None
+
+    def iter_chunks(self):
+        for part in self.candidates:
+            for pos in range(0, len(part), self.chunk_size):
+                yield part[pos:pos + self.chunk_size]
+
+    def fetch(self, count=None, cancelled=None):
+        '''
+        Finds matches until there are count of them (or all of them).
+        Returns False if the search was cancelled.
+        '''
+        while not self.exhausted and (count is None or len(self.matches) < count):
+            if self.chunk_matches is None:
+                if cancelled and cancelled():
+                    return False
+                self.chunk = next(self.chunks, None)
+                if self.chunk is None:
+                    self.exhausted = True
+                    break
+                self.chunk_matches = self.engine.iter_many(self.corpus, self.chunk, self.skip)
+            match = next(self.chunk_matches, None)
+            if match is None:
+                self.last_scanned = self.chunk[-1]
+                self.chunk_matches = None
+            else:
+                self.last_scanned = match[0]
+                self.matches.append(match)
+        return True
+
+    def get_narrowing_candidates(self):
+        '''
+        Returns candidates for the search with the narrowing pattern:
+        found matches and the candidates that are not searched yet.
+        '''
+        candidates = [[index for index, _, _ in self.matches]]
+        if not self.exhausted:
+            for part in self.candidates:
+                pos = bisect.bisect_right(part, self.last_scanned)
+                if pos < len(part):
+                    candidates.append(part[pos:])
+        return candidates
+
 
 class FuzzySearchEngine(SearchEngine):
     r'''
@@ -141,7 +463,7 @@ class FuzzySearchEngine(SearchEngine):
         self.narrowing_parts = narrowing_parts or []
         self.minimal_fuzzy_pattern_len = max(minimal_fuzzy_pattern_len, 2)
         if not case_sensitive:
-            pattern = pattern.lower()
+            pattern = fold_case(pattern)
         self.pattern = pattern
 
         eol_pos = pattern.find("$")
@@ -152,6 +474,27 @@ class FuzzySearchEngine(SearchEngine):
         for substr in pattern.split("*"):
             if substr:
                 self.automatons.append(self.build_fda(substr))
+        self.compile_automatons()
+
+    def compile_automatons(self):
+        # every symbol of the pattern gets its own class, the rest of symbols fall into class 0
+        alphabet = set()
+        for automaton in self.automatons:
+            alphabet.update(symbol for symbol in automaton.get_symbols())
+        alphabet = sorted(alphabet)
+        classes = {symbol: index for index, symbol in enumerate(alphabet, start=1)}
+        self.symbol_classes = SymbolClasses((ord(symbol), chr(index)) for symbol, index in classes.items())
+        self.classes_number = len(alphabet) + 1
+        for automaton in self.automatons:
+            automaton.compile(classes)
+
+    def encode(self, string):
+        # maps symbols of the string to their classes
+        translated = string.translate(self.symbol_classes)
+        if self.classes_number <= 256:
+            # bytes indexing is the fastest way to get int
+            return translated.encode("latin-1")
+        return [ord(symbol) for symbol in translated]
 
     @staticmethod
     def get_subpatterns(narrowing_parts, pattern, len_threshold):
@@ -250,9 +593,34 @@ class FuzzySearchEngine(SearchEngine):
         state.right_state = core_states[level]
         return Automaton(init_state, finite_state, pattern)
 
-    def search_automaton(self, string, pos, automaton):
+    def search_automaton(self, string, pos, automaton, codes=None):
         strlen = len(string)
         # search string is less than the pattern - a definite mismatch
+        if (strlen - pos) < automaton.depth:
+            return None
+        if codes is None:
+            codes = self.encode(string)
+        # see Automaton.compile()
+        rows = automaton.rows
+        finite_state = automaton.finite_id
+        state = 0
+        index = pos
+        while index < strlen:
+            state = rows[state][codes[index]]
+            if state < 0:
+                # there is no match - back on the number of done steps to start from the beginning
+                index += state + 1
+                state = 0
+            index += 1
+
+            if state == finite_state:
+                start = index - automaton.depth
+                end = index
+                return MatchObject(string, self.original_pattern, string[start:end], start, end)
+
+    def search_automaton_graph(self, string, pos, automaton, codes=None):
+        # walks the graph of State objects, kept to compare with the table-driven implementation (see benchmarks/search_engines.py)
+        strlen = len(string)
         if (strlen - pos) < automaton.depth:
             return None
         state = automaton.init_state
@@ -265,7 +633,6 @@ class FuzzySearchEngine(SearchEngine):
             elif state.right:
                 state = state.right_state
             else:
-                # there is no match - back on the number of done steps to start from the beginning
                 index -= state.level
                 state = automaton.init_state
             index += 1
@@ -275,10 +642,11 @@ class FuzzySearchEngine(SearchEngine):
                 end = index
                 return MatchObject(string, self.original_pattern, string[start:end], start, end)
 
-    def search(self, string, pos=0):
+    def search(self, string, pos=0, folded=None):
         original_string = string
         if not self.case_sensitive:
-            string = string.lower()
+            string = folded if folded is not None else fold_case(string)
+        codes = self.encode(string) if self.automatons else None
         matches = []
         for automaton in self.automatons:
             last_automaton = (automaton == self.automatons[-1])
@@ -286,14 +654,14 @@ class FuzzySearchEngine(SearchEngine):
             # support '$' symbol
             if last_automaton and self.end_of_line:
                 while pos < len(string):
-                    match = self.search_automaton(string, pos, automaton)
+                    match = self.search_automaton(string, pos, automaton, codes)
                     if not match:
                         return None
                     if match.end() == len(string):
                         break
                     pos = match.end()
             else:
-                match = self.search_automaton(string, pos, automaton)
+                match = self.search_automaton(string, pos, automaton, codes)
             if not match:
                 return None
             matches.append(match)
@@ -304,13 +672,23 @@ class FuzzySearchEngine(SearchEngine):
         end = matches[-1].end()
         return MatchObject(original_string, self.pattern, original_string[start:end], start, end)
 
-    def get_state_name(self, state):
-        return "Node_{}_{}{}{}\n{}".format(
-            state.level,
-            state.left or "",
-            state.middle or "",
-            "?" if state.right else "",
-            id(state))
+    def narrows(self, previous):
+        if type(previous) is not type(self):
+            return False
+        options = (self.case_sensitive, self.minimal_fuzzy_pattern_len, self.narrowing_parts)
+        if options != (previous.case_sensitive, previous.minimal_fuzzy_pattern_len, previous.narrowing_parts):
+            return False
+        return is_narrowing(previous.original_pattern, self.original_pattern, True, self.minimal_fuzzy_pattern_len, self.narrowing_parts)
+
+    def get_state_name(self, automaton_index, state):
+        automaton = self.automatons[automaton_index]
+        return "Node_{}_{}{}{}\n{}.{}".format(
+            automaton.levels[state],
+            automaton.lefts[state] or "",
+            automaton.middles[state] or "",
+            "?" if automaton.any_next[state] >= 0 else "",
+            automaton_index,
+            state)
 
     def dump_dot(self, filename):
         # to generate image:
@@ -318,37 +696,59 @@ class FuzzySearchEngine(SearchEngine):
         with open(filename, "w") as file:
             file.write("digraph G{\n")
             file.write('  graph [rankdir=LR label="pattern: {}"];\n'.format(self.pattern))
-            for index in range(len(self.automatons)):
-                queue = [self.automatons[index].init_state]
-                # the graph is acyclic, recursion is not possible
-                while queue:
-                    newQueue = set()
-                    for state in queue:
-                        nodeName = self.get_state_name(state)
-                        if state.left_state:
-                            file.write('  "{}"->"{}" [label="{}"];\n'.format(nodeName, self.get_state_name(state.left_state), state.left))
-                            newQueue.add(state.left_state)
-                        if state.middle_state:
-                            file.write('  "{}"->"{}" [label="{}"];\n'.format(nodeName, self.get_state_name(state.middle_state), state.middle))
-                            newQueue.add(state.middle_state)
-                        if state.right_state:
-                            file.write('  "{}"->"{}" [label="?"];\n'.format(nodeName, self.get_state_name(state.right_state)))
-                            newQueue.add(state.right_state)
-                    queue = newQueue
+            for index, automaton in enumerate(self.automatons):
+                for state in range(len(automaton.levels)):
+                    node_name = self.get_state_name(index, state)
+                    edges = [
+                        (automaton.left_next[state], automaton.lefts[state]),
+                        (automaton.middle_next[state], automaton.middles[state]),
+                        (automaton.any_next[state], "?"),
+                    ]
+                    for next_state, label in edges:
+                        if next_state >= 0:
+                            file.write('  "{}"->"{}" [label="{}"];\n'.format(node_name, self.get_state_name(index, next_state), label))
                 # draw a connection between several patterns
                 if index < len(self.automatons) - 1:
-                    init_state = self.get_state_name(self.automatons[index].finite_state)
-                    finite_state = self.get_state_name(self.automatons[index + 1].init_state)
+                    init_state = self.get_state_name(index, automaton.finite_id)
+                    finite_state = self.get_state_name(index + 1, 0)
                     file.write('  "{}"->"{}" [label="*"];\n'.format(init_state, finite_state))
                 else:
                     if self.end_of_line:
-                        file.write('  "{}"->"EOL";\n'.format(self.get_state_name(self.automatons[-1].finite_state)))
+                        file.write('  "{}"->"EOL";\n'.format(self.get_state_name(index, automaton.finite_id)))
             file.write("}\n")
 
 
+class SymbolClasses(dict):
+    '''
+    Translation table (see str.translate) of the symbols into their classes.
+    Symbols that are not in the pattern are mapped to class 0: ascii symbols up front,
+    the rest are cached on the first sight under the lock (engines are shared between threads).
+    '''
+
+    def __init__(self, items):
+        super(SymbolClasses, self).__init__((code, "\0") for code in range(128))
+        self.update(items)
+        self.lock = threading.Lock()
+
+    def __missing__(self, key):
+        with self.lock:
+            return self.setdefault(key, "\0")
+
+
 class Automaton(object):
+    '''
+    Graph of State objects is compiled into flat tables indexed by state id (init state is 0):
+     lefts, middles - symbols of the left and middle edges (or None)
+     left_next, middle_next, any_next - ids of the next states (-1 if there is no edge)
+     levels - levels of the states
+     rows - transition table: next state id for every symbol class,
+            negative value -(level + 1) means mismatch at the state of the level
+    '''
 
-    __slots__ = ['init_state', 'finite_state', 'pattern', 'depth']
+    __slots__ = [
+        'init_state', 'finite_state', 'pattern', 'depth',
+        'lefts', 'middles', 'left_next', 'middle_next', 'any_next', 'levels', 'rows', 'finite_id',
+    ]
 
     def __init__(self, init_state, finite_state, pattern):
         self.init_state = init_state
@@ -356,6 +756,52 @@ class Automaton(object):
         self.pattern = pattern
         self.depth = len(pattern)
 
+    def get_states(self):
+        states = [self.init_state]
+        visited = {id(self.init_state)}
+        # the graph is acyclic
+        for state in states:
+            for next_state in (state.left_state, state.middle_state, state.right_state):
+                if next_state is not None and id(next_state) not in visited:
+                    visited.add(id(next_state))
+                    states.append(next_state)
+        return states
+
+    def get_symbols(self):
+        symbols = set()
+        for state in self.get_states():
+            symbols.update(symbol for symbol in (state.left, state.middle) if symbol is not None)
+        return symbols
+
+    def compile(self, classes):
+        states = self.get_states()
+        ids = {id(state): index for index, state in enumerate(states)}
+
+        def get_id(state):
+            return -1 if state is None else ids[id(state)]
+
+        self.lefts = [state.left for state in states]
+        self.middles = [state.middle for state in states]
+        self.left_next = [get_id(state.left_state) for state in states]
+        self.middle_next = [get_id(state.middle_state) for state in states]
+        self.any_next = [get_id(state.right_state) for state in states]
+        self.levels = [state.level for state in states]
+        self.finite_id = get_id(self.finite_state)
+
+        self.rows = []
+        for index in range(len(states)):
+            if self.any_next[index] >= 0:
+                default = self.any_next[index]
+            else:
+                default = -(self.levels[index] + 1)
+            row = [default] * (len(classes) + 1)
+            # left edge has priority over the middle one
+            if self.middles[index] is not None:
+                row[classes[self.middles[index]]] = self.middle_next[index]
+            if self.lefts[index] is not None:
+                row[classes[self.lefts[index]]] = self.left_next[index]
+            self.rows.append(row)
+
 
 class State(object):
 
@@ -377,47 +823,269 @@ class State(object):
         self.middle_state = None
         self.right_state = None
 
-# -----------------------------------------------------------------------------
-
-def compare():
-    import time
-    testdata = [
-        (
-            ["pretty fast and furious/"] * 1000,
-            ["fast", "fats", "ast", "tsaf", "fas*us", "fat*us", "fat*us$"],
-        ),
-        (
-            # no match at all
-            ["Then they came for me - and there was no one left to speak for me"] * 1000,
-            ["fast", "fast" * 30]
-        ),
-        (
-            # long match
-            ["pretty fast and fat and fat and fat and fat and fat and fat fast fat fast/"] * 1000,
-            ["fast*fast", "fast*fast$", "fsat*fats$"],
-        ),
-        (
-            # worst case - long string, long pattern, almost match
-            ["a" * 80 + "bba"] * 1000,
-            ["a" * 40 + "bba"]
-        )
-    ]
 
-    for data, patterns in testdata:
-        for pattern in patterns:
-            print("\nPattern: " + pattern)
-            for engine in (RegexSearchEngine, FuzzySearchEngine):
-                start = time.time()
-                se = engine(pattern)
-                for line in data:
-                    match = se.search(line)
-                end = time.time()
-                print("{:20} ({:4}:{:4}) {:0.6f}s {}".format(
-                    engine.__name__,
-                    match.start() if match else None,
-                    match.end() if match else None,
-                    end - start,
-                    match.group() if match else None))
-
-if __name__ == '__main__':
-    compare()
+class BitapSearchEngine(SearchEngine):
+    r'''
+    Approximate search with up to max_errors edits for each substring of pattern, separated by '*'.
+    Supported edits: insertion, deletion, substitution and transposition of two adjacent characters
+    (optimal string alignment distance).
+    Bit-parallel (Wu–Manber) algorithm is used: for every number of errors d there is a bit vector,
+    where bit j is set if pattern[:j + 1] matches the text ending at the current position with at most d errors.
+
+    Number of allowed errors grows with the length of the substring:
+    substrings shorter than minimal_fuzzy_pattern_len are searched directly,
+    then one more error is allowed for every errors_step characters (up to max_errors).
+    Narrowing parts (e.g. '/') of the pattern are never edited.
+    '''
+
+    def __init__(self, pattern, case_sensitive=False, max_errors=2, minimal_fuzzy_pattern_len=3, narrowing_parts=None, errors_step=4):
+        super(BitapSearchEngine, self).__init__(pattern, case_sensitive)
+        self.original_pattern = pattern
+        self.case_sensitive = case_sensitive
+        self.max_errors = max_errors
+        self.minimal_fuzzy_pattern_len = max(minimal_fuzzy_pattern_len, 2)
+        self.narrowing_parts = narrowing_parts or []
+        self.errors_step = errors_step
+        if not case_sensitive:
+            pattern = fold_case(pattern)
+        self.pattern = pattern
+
+        eol_pos = pattern.find("$")
+        self.end_of_line = eol_pos != -1
+        if self.end_of_line:
+            pattern = pattern[:eol_pos]
+        self.parts = []
+        for substr in pattern.split("*"):
+            if substr:
+                self.parts.append(BitapPattern(substr, self.get_errors_limit(len(substr)), self.get_fixed_positions(substr)))
+
+    def get_errors_limit(self, length):
+        if length < self.minimal_fuzzy_pattern_len:
+            return 0
+        return min(self.max_errors, 1 + (length - self.minimal_fuzzy_pattern_len) // self.errors_step)
+
+    def get_fixed_positions(self, pattern):
+        positions = set()
+        for narrow in self.narrowing_parts:
+            pos = pattern.find(narrow)
+            while pos != -1:
+                positions.update(range(pos, pos + len(narrow)))
+                pos = pattern.find(narrow, pos + 1)
+        return positions
+
+    def narrows(self, previous):
+        if type(previous) is not type(self):
+            return False
+        options = (self.case_sensitive, self.max_errors, self.minimal_fuzzy_pattern_len, self.narrowing_parts, self.errors_step)
+        if options != (previous.case_sensitive, previous.max_errors, previous.minimal_fuzzy_pattern_len, previous.narrowing_parts, previous.errors_step):
+            return False
+        if not is_narrowing(previous.original_pattern, self.original_pattern):
+            return False
+        # the rest of the pattern is ignored after '$'
+        if previous.end_of_line:
+            return True
+        # extended part must not get more errors
+        for previous_part, part in zip(previous.parts, self.parts):
+            if previous_part.errors != part.errors:
+                return False
+        return True
+
+    def search(self, string, pos=0, folded=None):
+        original_string = string
+        if not self.case_sensitive:
+            string = folded if folded is not None else fold_case(string)
+        if not self.parts:
+            return None
+        start = None
+        for part in self.parts:
+            # support '$' symbol
+            end_of_line = self.end_of_line and part is self.parts[-1]
+            end = part.find_end(string, pos, end_of_line)
+            if end is None:
+                return None
+            if start is None:
+                start = part.find_start(string, pos, end)
+            pos = end
+        return MatchObject(original_string, self.pattern, original_string[start:end], start, end)
+
+
+class BitapPattern(object):
+    '''
+    Substring of the BitapSearchEngine's pattern with its bit masks.
+    Edits are not allowed at the fixed positions.
+    '''
+
+    __slots__ = ['pattern', 'length', 'errors', 'masks', 'counts', 'edit_mask', 'transposition_mask', 'reversed']
+
+    def __init__(self, pattern, errors, fixed_positions=(), build_reversed=True):
+        self.pattern = pattern
+        self.length = len(pattern)
+        self.errors = errors
+        self.masks = {}
+        for index, symbol in enumerate(pattern):
+            self.masks[symbol] = self.masks.get(symbol, 0) | (1 << index)
+        # symbol -> number of its occurrences in the pattern (for the prefilter)
+        self.counts = [(symbol, pattern.count(symbol)) for symbol in self.masks]
+        # bit j allows substitution/deletion of pattern[j] and insertion after it
+        self.edit_mask = 0
+        # bit j allows transposition of pattern[j - 1] and pattern[j]
+        self.transposition_mask = 0
+        for index in range(self.length):
+            if index not in fixed_positions:
+                self.edit_mask |= 1 << index
+                if index > 0 and index - 1 not in fixed_positions:
+                    self.transposition_mask |= 1 << index
+        self.reversed = None
+        if build_reversed:
+            reversed_fixed = {self.length - 1 - index for index in fixed_positions}
+            self.reversed = BitapPattern(pattern[::-1], errors, reversed_fixed, build_reversed=False)
+
+    def get_initial_rows(self):
+        # leading characters of the pattern may be deleted
+        rows = [0]
+        for _ in range(self.errors):
+            rows.append(rows[-1] | (((rows[-1] << 1) | 1) & self.edit_mask))
+        return rows
+
+    def step(self, rows, prev_rows, new_rows, symbol, prev_symbol, start):
+        # new_rows is filled in place, start is 1 if the match may start at the current symbol
+        masks = self.masks
+        mask = masks.get(symbol, 0)
+        row = ((rows[0] << 1) | start) & mask
+        new_rows[0] = row
+        if self.errors:
+            edit_mask = self.edit_mask
+            transposition = (mask << 1) & masks.get(prev_symbol, 0) & self.transposition_mask
+            for errors in range(1, self.errors + 1):
+                lower = rows[errors - 1]
+                # substitution, insertion and deletion
+                deletion = (row << 1) | start
+                row = (((rows[errors] << 1) | start) & mask) | ((((lower << 1) | start) | lower | deletion) & edit_mask)
+                if transposition:
+                    row |= ((prev_rows[errors - 1] << 2) | (start << 1)) & transposition
+                new_rows[errors] = row
+
+    def get_errors(self, rows):
+        # returns the minimal number of errors of the full pattern match (or None)
+        final = 1 << (self.length - 1)
+        for errors, row in enumerate(rows):
+            if row & final:
+                return errors
+        return None
+
+    def may_match(self, string, pos):
+        # substitution and deletion lose a single symbol of the pattern, insertion and transposition - none,
+        # so the match is impossible if the string misses more symbols than errors allowed
+        if len(string) - pos < self.length - self.errors:
+            return False
+        missing = 0
+        for symbol, count in self.counts:
+            if string.find(symbol, pos) == -1:
+                missing += count
+                if missing > self.errors:
+                    return False
+        return True
+
+    def find_end(self, string, pos, end_of_line=False):
+        '''
+        Returns end of the leftmost match.
+        If there are better matches (with less errors) ending within the next few symbols, the best is taken.
+        '''
+        if not self.errors:
+            # exact match
+            if end_of_line:
+                found = string.endswith(self.pattern) and len(string) - self.length >= pos
+                return len(string) if found else None
+            start = string.find(self.pattern, pos)
+            return None if start == -1 else start + self.length
+        if end_of_line:
+            # the match is at most errors longer than the pattern
+            pos = max(pos, len(string) - self.length - self.errors)
+        if not self.may_match(string, pos):
+            return None
+        if self.errors <= 2:
+            return self.find_end_unrolled(string, pos, end_of_line)
+        strlen = len(string)
+        # rows are swapped, not allocated per symbol
+        rows = self.get_initial_rows()
+        prev_rows = list(rows)
+        new_rows = list(rows)
+        prev_symbol = None
+        best = None
+        for index in range(pos, strlen):
+            symbol = string[index]
+            self.step(rows, prev_rows, new_rows, symbol, prev_symbol, 1)
+            prev_rows, rows, new_rows = rows, new_rows, prev_rows
+            prev_symbol = symbol
+            if end_of_line and index != strlen - 1:
+                continue
+            errors = self.get_errors(rows)
+            if errors is not None and (best is None or errors < best[0]):
+                best = (errors, index + 1)
+            if best and (best[0] == 0 or index - best[1] + 1 >= self.errors):
+                break
+        if best:
+            return best[1]
+        return None
+
+    def find_end_unrolled(self, string, pos, end_of_line):
+        # find_end() for up to 2 errors (the default) with the rows in local variables, see step()
+        masks = self.masks
+        edit_mask = self.edit_mask
+        transposition_mask = self.transposition_mask
+        final = 1 << (self.length - 1)
+        max_errors = self.errors
+        strlen = len(string)
+        row0, row1, row2 = (self.get_initial_rows() + [0])[:3]
+        prev_row0 = prev_row1 = new_row2 = 0
+        prev_mask = 0
+        best_errors = best_end = None
+        for index, symbol in enumerate(string[pos:], pos):
+            mask = masks.get(symbol, 0)
+            transposition = (mask << 1) & prev_mask & transposition_mask
+            new_row0 = ((row0 << 1) | 1) & mask
+            new_row1 = (((row1 << 1) | 1) & mask) | (((row0 << 1) | 1 | row0 | (new_row0 << 1)) & edit_mask)
+            if transposition:
+                new_row1 |= ((prev_row0 << 2) | 2) & transposition
+            if max_errors == 2:
+                new_row2 = (((row2 << 1) | 1) & mask) | (((row1 << 1) | 1 | row1 | (new_row1 << 1)) & edit_mask)
+                if transposition:
+                    new_row2 |= ((prev_row1 << 2) | 2) & transposition
+            prev_row0, prev_row1 = row0, row1
+            row0, row1, row2 = new_row0, new_row1, new_row2
+            prev_mask = mask
+            if (row0 | row1 | row2) & final and (not end_of_line or index == strlen - 1):
+                if row0 & final:
+                    return index + 1
+                errors = 1 if row1 & final else 2
+                if best_errors is None or errors < best_errors:
+                    best_errors, best_end = errors, index + 1
+            if best_end is not None and index - best_end + 1 >= max_errors:
+                break
+        return best_end
+
+    def find_start(self, string, pos, end):
+        # reversed pattern is matched from the end of the match backwards, the match must end exactly at 'end'
+        # the longest of the best matches is taken
+        if not self.errors:
+            return end - self.length
+        pattern = self.reversed
+        rows = pattern.get_initial_rows()
+        prev_rows = list(rows)
+        new_rows = list(rows)
+        prev_symbol = None
+        best = None
+        start = 1
+        for index in range(end - 1, max(pos, end - self.length - self.errors) - 1, -1):
+            symbol = string[index]
+            pattern.step(rows, prev_rows, new_rows, symbol, prev_symbol, start)
+            prev_rows, rows, new_rows = rows, new_rows, prev_rows
+            prev_symbol = symbol
+            start = 0
+            errors = pattern.get_errors(rows)
+            if errors is not None and (best is None or errors <= best[0]):
+                best = (errors, index)
+        if best:
+            return best[1]
+        return end - self.length
+
@@ -0,0 +1,83 @@
+# coding: utf-8
+
+'''
+Startup stages tracing (jumper's --stages flag).
+Stages are always recorded, it's cheap. The breakdown is appended to the log
+and printed only if tracing is requested, so slow phases can be found on particular hosts.
+'''
+
+import os
+import sys
+import time
+import contextlib
+
+
+LOG_NAME = "stages.log"
+
+
+class StageTracer(object):
+
+    def __init__(self, started=None):
+        self.started = started or time.time()
+        # [name, start, end]
+        self.stages = []
+        self.running = {}
+
+    def start(self, name):
+        entry = [name, time.time(), None]
+        self.stages.append(entry)
+        self.running[name] = entry
+
+    def finish(self, name):
+        entry = self.running.pop(name, None)
+        if entry:
+            entry[2] = time.time()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.finish(name)
+
+    def get_breakdown(self):
+        # returns list of (name, seconds) of finished stages
+        return [(name, end - start) for name, start, end in self.stages if end is not None]
+
+    def format(self, indent=""):
+        now = time.time()
+        lines = ["{}total {:.5f}s".format(indent, now - self.started)]
+        for name, duration in self.get_breakdown():
+            lines.append("{}  {:24} {:.5f}s".format(indent, name, duration))
+        return lines
+
+    def write_log(self, filename):
+        header = "[{}] pid {}: {}".format(time.strftime("%Y-%m-%d %H:%M:%S"), os.getpid(), " ".join(sys.argv[1:]))
+        with open(filename, "a") as afile:
+            afile.write("\n".join([header] + self.format(indent="  ")) + "\n")
+
+
+tracer = StageTracer()
+
+
+def start(name):
+    tracer.start(name)
+
+
+def finish(name):
+    tracer.finish(name)
+
+
+def stage(name):
+    return tracer.stage(name)
+
+
+def get_log_filename(config):
+    return os.path.join(os.path.dirname(config["history_file"]), LOG_NAME)
+
+
+def report(config, stream=sys.stderr):
+    filename = get_log_filename(config)
+    tracer.write_log(filename)
+    stream.write("\n".join(["Stages (see '{}'):".format(filename)] + tracer.format()) + "\n")
@@ -4,16 +4,58 @@ import os
 import re
 import sys
 import copy
-import json
-import time
 import fcntl
 import struct
 import termios
 import contextlib
+import collections
 
 
 HOMEDIR = os.environ["HOME"]
 REALHOMEDIR = os.path.realpath(os.environ["HOME"])
+# seconds, see is_racy
+RACY_INTERVAL = 2
+
+
+class LRUCache(object):
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.data = collections.OrderedDict()
+
+    def get(self, key, default=None):
+        if key not in self.data:
+            return default
+        self.data.move_to_end(key)
+        return self.data[key]
+
+    def put(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        while len(self.data) > self.limit:
+            self.data.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+
+def is_racy(mtime_ns, now):
+    '''
+    mtime granularity is coarse - a file (directory) read about the time of its modification
+    might be modified again without mtime change, so the cached result of the read can't be trusted.
+    '''
+    return now - mtime_ns / 10.0 ** 9 < RACY_INTERVAL
+
+
+def write_file_atomically(filename, data):
+    # readers see the old or the new file, the temporary file isn't shared with concurrent writers
+    tmp_filename = "{}.{}.tmp".format(filename, os.getpid())
+    with open(tmp_filename, "wb" if isinstance(data, bytes) else "w") as afile:
+        afile.write(data)
+    os.rename(tmp_filename, filename)
 
 
 def copy_to_clipboard(path):
@@ -28,13 +70,16 @@ def copy_to_clipboard(path):
 
 
 def obtain_lockfile(fd):
-    while True:
-        try:
-            fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
-            return
-        except IOError:
-            time.sleep(0.1)
-            continue
+    # waits for the lock without polling
+    fcntl.lockf(fd, fcntl.LOCK_EX)
+
+
+def try_lockfile(fd):
+    try:
+        fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except IOError:
+        return False
 
 
 def replace_home_with_tilde(path):
@@ -62,6 +107,8 @@ def get_module_path():
 
 
 def load_json(filename):
+    # the config is parsed only when its cache is outdated (see core.load_cached_config)
+    import json
     with open(filename) as file:
         data = file.read()
     # remove comments
@@ -99,7 +146,18 @@ def get_stdin_buffer(one_line=False):
 
 
 def get_dirs(path):
-    return [dir for dir in os.listdir(path) if os.path.isdir(os.path.join(path, dir))]
+    # python 3.4
+    if not hasattr(os, "scandir"):
+        return [dir for dir in os.listdir(path) if os.path.isdir(os.path.join(path, dir))]
+    # file type is known from the directory entry, only symlinks are resolved with stat
+    dirs = []
+    for entry in os.scandir(path):
+        try:
+            if entry.is_dir():
+                dirs.append(entry.name)
+        except OSError:
+            pass
+    return dirs
 
 
 def get_cwd():
@@ -170,8 +228,30 @@ def with_status(msg, stream=sys.stdout, truncate=False):
     remove_status()
 
 
-def get_bashrc():
-    filename = os.path.expanduser('~/.bashrc')
+# shell -> (hook, startup file, alias line)
+SHELL_HOOKS = {
+    "bash": ("fastcd_hook.sh", "~/.bashrc", "alias {}=fastcd"),
+    "zsh": ("fastcd_hook.zsh", "${ZDOTDIR}/.zshrc", "alias {}=fastcd"),
+    "fish": ("fastcd_hook.fish", "${XDG_CONFIG_HOME}/fish/config.fish", "alias {} fastcd"),
+}
+
+
+def get_shell():
+    shell = os.path.basename(os.environ.get("SHELL", ""))
+    if shell in SHELL_HOOKS:
+        return shell
+    return "bash"
+
+
+def get_shell_rc_filename(shell):
+    defaults = {"ZDOTDIR": HOMEDIR, "XDG_CONFIG_HOME": os.path.join(HOMEDIR, ".config")}
+    filename = SHELL_HOOKS[shell][1]
+    for name, default in defaults.items():
+        filename = filename.replace("${" + name + "}", os.environ.get(name) or default)
+    return os.path.expanduser(filename)
+
+
+def get_shell_rc(filename):
     if not os.path.exists(filename):
         return ''
 
@@ -179,23 +259,32 @@ def get_bashrc():
         return afile.read()
 
 
-def dump_bashrc(data):
-    with open(os.path.expanduser('~/.bashrc'), 'w') as afile:
+def dump_shell_rc(filename, data):
+    dirname = os.path.dirname(filename)
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+    with open(filename, 'w') as afile:
         return afile.write(data)
 
 
-def install_shell_hook(alias_name):
-    module_path = get_module_path()
-    filename = os.path.join(module_path, 'fastcd_hook.sh')
+def install_shell_hook(alias_name, shell=None):
+    '''
+    Installs the hook of the current shell, returns its startup file.
+    '''
+    shell = shell or get_shell()
+    hook_name, _, alias_line = SHELL_HOOKS[shell]
+    filename = os.path.join(get_module_path(), hook_name)
+    rc_filename = get_shell_rc_filename(shell)
 
-    bashrc_data = get_bashrc()
-    pattern = r'source "(.*/fastcd_hook.sh)"; alias (\S+)=fastcd'
-    install_line = 'source "{}"; alias {}=fastcd'.format(filename, alias_name)
+    rc_data = get_shell_rc(rc_filename)
+    pattern = r'source "(.*/fastcd_hook\.(?:sh|zsh|fish))"; alias (\S+)[= ]fastcd'
+    install_line = 'source "{}"; {}'.format(filename, alias_line.format(alias_name))
 
-    match = re.search(pattern, bashrc_data)
+    match = re.search(pattern, rc_data)
     if not match :
-        bashrc_data += '\n{}\n'.format(install_line)
-        dump_bashrc(bashrc_data)
+        rc_data += '\n{}\n'.format(install_line)
+        dump_shell_rc(rc_filename, rc_data)
     elif match.group(1) != filename or match.group(2) != alias_name:
-        bashrc_data = re.sub(pattern, install_line, bashrc_data)
-        dump_bashrc(bashrc_data)
+        rc_data = re.sub(pattern, lambda _: install_line, rc_data)
+        dump_shell_rc(rc_filename, rc_data)
+    return rc_filename
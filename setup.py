@@ -29,7 +29,7 @@ setuptools.setup(
     author_email="ivansduck@gmail.com",
     url="https://github.com/frazenshtein/fastcd",
     packages=["fastcd"],
-    package_data={"fastcd": ["config.json", "fastcd_hook.sh"]},
+    package_data={"fastcd": ["config.json", "fastcd_hook.sh", "fastcd_hook.zsh", "fastcd_hook.fish"]},
     python_requires='>=3.4',
     install_requires=["urwid>=1.2"],
     classifiers=[
@@ -0,0 +1,285 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+import unittest
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(ROOT_DIR)
+
+from fastcd import core, util
+
+
+def make_history_config(tmpdir):
+    # history in its own directory - the lockfile is created next to it
+    filename = os.path.join(tmpdir, "data", "history.txt")
+    os.mkdir(os.path.dirname(filename))
+    return {
+        "history_file": filename,
+        "history_limit": 10,
+        "history_journal_size_limit": 1000,
+        "skip_list": [],
+        "check_directory_existence": 0,
+    }
+
+
+class CoreTests(unittest.TestCase):
+
+    def test_headless_import(self):
+        code = "import sys, fastcd.jumper; sys.exit('urwid' in sys.modules)"
+        self.assertEqual(subprocess.call([sys.executable, "-c", code], cwd=ROOT_DIR), 0)
+
+    def test_config_cache(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            ref_filename = os.path.join(tmpdir, "ref.json")
+            user_filename = os.path.join(tmpdir, "user.json")
+            cache_filename = os.path.join(tmpdir, "cache", core.CONFIG_CACHE_NAME)
+            with open(ref_filename, "w") as afile:
+                afile.write('''/* comment */ {"history_file": "~/h", "shortcuts_paths_file": "~/s",
+                    "user_config_file": "%s", "history_limit": 10, "skip_list": []}''' % user_filename)
+            with open(user_filename, "w") as afile:
+                afile.write('{"history_limit": 20}')
+            # files older than the racy interval
+            for filename in [ref_filename, user_filename]:
+                os.utime(filename, (time.time() - 10, time.time() - 10))
+
+            config = core.load_cached_config(ref_filename, cache_filename)
+            self.assertEqual(config["history_limit"], 20)
+            self.assertEqual(config["history_file"], os.path.expanduser("~/h"))
+            self.assertTrue(os.path.exists(cache_filename))
+            self.assertEqual(core.load_cached_config(ref_filename, cache_filename), config)
+
+            with open(user_filename, "w") as afile:
+                afile.write('{"history_limit": 30, "skip_list": ["^/tmp"]}')
+            config = core.load_cached_config(ref_filename, cache_filename)
+            self.assertEqual((config["history_limit"], config["skip_list"]), (30, ["^/tmp"]))
+
+            with open(cache_filename, "w") as afile:
+                afile.write("broken")
+            self.assertEqual(core.load_cached_config(ref_filename, cache_filename)["history_limit"], 30)
+
+    def test_prepare_environment(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config = {
+                "history_file": os.path.join(tmpdir, "data", "history.txt"),
+                "shortcuts_paths_file": os.path.join(tmpdir, "data", "shortcuts_paths.txt"),
+                "user_config_file": os.path.join(tmpdir, "data", "config.json"),
+            }
+            core.prepare_environment(config)
+            for param in core.CONFIG_PATHS:
+                self.assertTrue(os.path.exists(config[param]))
+            self.assertTrue(os.path.exists(core.get_environment_stamp_filename(config)))
+            # stamp is checked only
+            os.unlink(config["shortcuts_paths_file"])
+            core.prepare_environment(config)
+            self.assertFalse(os.path.exists(config["shortcuts_paths_file"]))
+            core.store_shortcut_path(config["shortcuts_paths_file"], "/a", 1)
+            self.assertEqual(core.get_shortcut_paths(config["shortcuts_paths_file"], 2), ["", "/a"])
+            # paths are changed
+            config["shortcuts_paths_file"] = os.path.join(tmpdir, "other", "shortcuts_paths.txt")
+            core.prepare_environment(config)
+            self.assertTrue(os.path.exists(config["shortcuts_paths_file"]))
+
+    def test_path_strip(self):
+        self.assertEqual(core.path_strip("/"), "/")
+        self.assertEqual(core.path_strip("/a/b/"), "/a/b")
+
+    def test_normalize_path(self):
+        self.assertEqual(core.normalize_path("/a//b///c/"), "/a/b/c")
+
+    def test_fold_journal(self):
+        self.assertEqual(core.fold_journal(["/a", "/b", "/c"], ["/c", "/d", "/b"]), ["/b", "/d", "/c", "/a"])
+        self.assertEqual(core.fold_journal(["/a"], []), ["/a"])
+
+    def test_history_journal(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "history.txt")
+            self.assertEqual(core.read_path_list(filename), [])
+            core.update_path_list(filename, ["/a", "/b"], 10, ["^/skip"], 1000)
+            # history is filtered with the new skip list at once
+            self.assertEqual(core.read_lines(filename), ["/b", "/a"])
+            core.update_path_list(filename, ["/skip/c", "/a"], 10, ["^/skip"], 1000)
+            self.assertEqual(core.read_path_list(filename), ["/a", "/skip/c", "/b"])
+            self.assertEqual(core.read_lines(filename), ["/b", "/a"])
+            # exceed journal size limit
+            core.update_path_list(filename, ["/d"], 2, ["^/skip"], 10)
+            self.assertEqual(core.read_lines(filename), ["/d", "/a"])
+            self.assertEqual(core.read_lines(core.get_journal_filename(filename)), [])
+            self.assertEqual(core.read_path_list(filename), ["/d", "/a"])
+
+    def test_spool(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config = make_history_config(tmpdir)
+            filename = config["history_file"]
+            # paths of the writers waiting for the lock
+            spooled = [core.spool_paths(filename, ["/a", "/b"]), core.spool_paths(filename, ["/c"])]
+            self.assertEqual(spooled, sorted(spooled))
+            open(os.path.join(core.get_spool_dirname(filename), ".incomplete"), "w").close()
+            core.record_paths(config, ["/d"])
+            self.assertEqual(core.read_path_list(filename), ["/c", "/b", "/a", "/d"])
+            self.assertEqual(os.listdir(core.get_spool_dirname(filename)), [".incomplete"])
+
+    def test_spool_order(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config = make_history_config(tmpdir)
+            filename = config["history_file"]
+            code = "import sys, json; from fastcd import core; core.record_paths(json.loads(sys.argv[1]), ['/b'])"
+            with open(core.get_history_lockfile(filename), "w+") as lock:
+                self.assertTrue(util.try_lockfile(lock))
+                # the writer comes while the lock is held
+                writer = subprocess.Popen([sys.executable, "-c", code, json.dumps(config)], cwd=ROOT_DIR)
+                deadline = time.time() + 5
+                while not core.read_spool(filename)[0] and time.time() < deadline:
+                    time.sleep(0.01)
+                core.commit_paths(filename, ["/a"], config["history_limit"], [], config["history_journal_size_limit"])
+            self.assertEqual(writer.wait(5), 0)
+            # the spooled path is more recent than the path of the lock holder
+            self.assertEqual(core.read_path_list(filename), ["/b", "/a"])
+            self.assertEqual(os.listdir(core.get_spool_dirname(filename)), [])
+
+    def test_recent_path(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config = make_history_config(tmpdir)
+            filename = config["history_file"]
+            self.assertIsNone(core.get_recent_path(filename))
+            core.write_path_list(filename, ["/a", "/b"])
+            self.assertEqual(core.get_recent_path(filename), "/a")
+            core.add_path(config, "/c/")
+            core.add_path(config, "/d")
+            core.add_path(config, "/d/")
+            self.assertEqual(core.read_lines(core.get_journal_filename(filename)), ["/d"])
+            self.assertEqual(core.read_path_list(filename), ["/d", "/c", "/a", "/b"])
+            core.append_path_list(filename, ["/long" * 100, "/e"])
+            self.assertEqual(core.get_recent_path(filename, chunk_size=10), "/e")
+            core.spool_paths(filename, ["/f"])
+            self.assertIsNone(core.get_recent_path(filename))
+
+    def test_install_shell_hook(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            environ = dict(os.environ)
+            try:
+                os.environ.update(ZDOTDIR=tmpdir, XDG_CONFIG_HOME=tmpdir, SHELL="/usr/bin/fish")
+                self.assertEqual(util.get_shell(), "fish")
+                rc_filename = util.install_shell_hook("j")
+                self.assertEqual(rc_filename, os.path.join(tmpdir, "fish", "config.fish"))
+                util.install_shell_hook("fcd")
+                with open(rc_filename) as afile:
+                    data = afile.read()
+                self.assertEqual(data.count("source"), 1)
+                self.assertIn("fastcd_hook.fish\"; alias fcd fastcd", data)
+                rc_filename = util.install_shell_hook("j", shell="zsh")
+                with open(rc_filename) as afile:
+                    self.assertIn("fastcd_hook.zsh\"; alias j=fastcd", afile.read())
+            finally:
+                os.environ.clear()
+                os.environ.update(environ)
+
+    def test_skip_list(self):
+        home = os.path.expanduser("~")
+        skip_list = core.SkipList(["/build$", "glob:*/node_modules/*", "glob:/tmp/[!a]?", "prefix:~/private/", "(x)\\1"])
+        for path in ["/a/build", "/a/node_modules/b", "/tmp/bc", "~/private", home + "/private/a", "/a/xx"]:
+            self.assertTrue(skip_list.match(path), path)
+        for path in ["/a/builds", "/a/node_modules", "/tmp/ab", "/tmp/bcd", "~/privateer", "/private", "/a/x"]:
+            self.assertFalse(skip_list.match(path), path)
+        self.assertTrue(core.in_skip_list("/a", ["(?i)/A"]))
+        # global flags of one pattern don't affect the others
+        self.assertTrue(core.in_skip_list("/B", ["^/a", "(?i)/b"]))
+        self.assertFalse(core.in_skip_list("/A", ["^/a", "(?i)/b"]))
+        self.assertEqual(len(core.compile_skip_list(["^/a", "(?i)/b"]).regexes), 2)
+        self.assertIs(core.compile_skip_list(["^/a"]), core.compile_skip_list(["^/a"]))
+        self.assertRaises(Exception, core.SkipList, ["("])
+        # the same group name in several patterns
+        skip_list = core.SkipList(["^/(?P<name>a)$", "^/(?P<name>b)$", "^/c"])
+        self.assertTrue(skip_list.match("/a") and skip_list.match("/b") and skip_list.match("/c"))
+        self.assertFalse(skip_list.match("/d"))
+        with self.assertRaisesRegex(ValueError, r"'\^/\(\?P<1>a\)'"):
+            core.SkipList(["^/b", "^/(?P<1>a)"])
+
+    def test_skip_list_change(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "history.txt")
+            core.update_path_list(filename, ["/a", "/b/c"], 10, [], 1000)
+            core.update_path_list(filename, ["/d"], 10, [], 1000)
+            self.assertEqual(core.read_lines(filename), ["/b/c", "/a"])
+            core.update_path_list(filename, ["/e"], 10, ["prefix:/b"], 1000)
+            self.assertEqual(core.read_lines(filename), ["/e", "/d", "/a"])
+
+    def test_get_dirs(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.mkdir(os.path.join(tmpdir, "dir"))
+            open(os.path.join(tmpdir, "file"), "w").close()
+            os.symlink(os.path.join(tmpdir, "dir"), os.path.join(tmpdir, "link"))
+            os.symlink(os.path.join(tmpdir, "missing"), os.path.join(tmpdir, "broken"))
+            self.assertEqual(sorted(util.get_dirs(tmpdir)), ["dir", "link"])
+
+    def test_lru_cache(self):
+        cache = util.LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        # access moves the key to the front
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+        self.assertNotIn("b", cache)
+        self.assertEqual([cache.get("a"), cache.get("c")], [1, 3])
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("b", 0), 0)
+        # update moves the key to the front as well
+        cache.put("a", 4)
+        cache.put("d", 5)
+        self.assertEqual(len(cache), 2)
+        self.assertNotIn("c", cache)
+        self.assertEqual(cache.get("a"), 4)
+
+    def test_listing_cache(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "listing_cache.txt")
+            root = os.path.join(tmpdir, "root")
+            for name in ["b", "A", "c"]:
+                os.makedirs(os.path.join(root, name))
+            open(os.path.join(root, "file"), "w").close()
+
+            cache = core.ListingCache(filename, 10, revalidate_interval=0)
+            self.assertEqual(cache.get_dirs(root), ["A", "b", "c"])
+            self.assertIsNone(cache.get_dirs(os.path.join(root, "file")))
+            self.assertIsNone(cache.get_dirs(os.path.join(root, "missing")))
+            # directory mtime is changed
+            os.mkdir(os.path.join(root, "d"))
+            self.assertEqual(cache.get_dirs(root), ["A", "b", "c", "d"])
+            cache.save()
+
+            # listing is taken from the cache while mtime is the same
+            cache = core.ListingCache(filename, 10)
+            cache.load()
+            mtime, listed, _ = cache.entries[root]
+            # listed long after the modification
+            cache.entries[root] = (mtime, mtime / 10.0 ** 9 + util.RACY_INTERVAL, ["cached"])
+            self.assertEqual(cache.get_dirs(root), ["cached"])
+            os.rmdir(os.path.join(root, "d"))
+            # validated recently
+            self.assertEqual(cache.get_dirs(root), ["cached"])
+            cache.validated.clear()
+            self.assertEqual(cache.get_dirs(root), ["A", "b", "c"])
+            os.rmdir(os.path.join(root, "A"))
+            cache.validated.clear()
+            self.assertEqual(cache.get_dirs(os.path.join(root, "A")), None)
+
+    def test_listing_cache_names(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "listing_cache.txt")
+            root = os.path.join(tmpdir, "root\tdir")
+            names = ["a\tb", "c\nd", " e ", "f\\tg"]
+            for name in names:
+                os.makedirs(os.path.join(root, name))
+            cache = core.ListingCache(filename, 10)
+            self.assertEqual(sorted(cache.get_dirs(root)), sorted(names))
+            cache.save()
+            cache = core.ListingCache(filename, 10)
+            cache.load()
+            self.assertEqual(list(cache.entries), [root])
+            self.assertEqual(sorted(cache.entries[root][2]), sorted(names))
+
+
+if __name__ == '__main__':
+    unittest.main()
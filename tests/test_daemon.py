@@ -0,0 +1,143 @@
+import os
+import sys
+import time
+import tempfile
+import threading
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fastcd import client, core, daemon
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class HistoryDaemonTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.tmpdir.name, "run", client.SOCKET_NAME)
+        self.config = {
+            "history_file": os.path.join(self.tmpdir.name, "history.txt"),
+            "history_limit": 100,
+            "history_journal_size_limit": 65536,
+            "skip_list": ["^/skip"],
+            "check_directory_existence": 0,
+            "daemon_flush_interval": 60,
+            "daemon_flush_batch": 3,
+        }
+        self.thread = None
+
+    def tearDown(self):
+        if self.thread:
+            self.daemon.stop()
+            self.thread.join(2)
+        self.tmpdir.cleanup()
+
+    def start(self, daemon_class=daemon.HistoryDaemon):
+        self.daemon = daemon_class(self.config, self.socket_path)
+        self.daemon.bind()
+        self.thread = threading.Thread(target=self.daemon.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def read_history(self):
+        return core.read_path_list(self.config["history_file"])
+
+    def test_add_path(self):
+        history_daemon = daemon.HistoryDaemon(self.config, self.socket_path)
+        for path in ["/a//b/", "/skip/c", "/a/b", "/d"]:
+            history_daemon.add_path(path)
+        self.assertEqual(history_daemon.pending, ["/a/b", "/d"])
+        self.assertFalse(history_daemon.is_flush_required())
+        history_daemon.flush()
+        self.assertEqual(self.read_history(), ["/d", "/a/b"])
+        self.assertEqual(history_daemon.pending, [])
+
+    def test_flush_error(self):
+        history_daemon = daemon.HistoryDaemon(self.config, self.socket_path)
+        record_paths = core.record_paths
+
+        def failing_record_paths(config, paths):
+            raise OSError(28, "No space left on device")
+
+        for path in ["/a", "/b", "/c"]:
+            history_daemon.add_path(path)
+        core.record_paths = failing_record_paths
+        try:
+            history_daemon.flush()
+        finally:
+            core.record_paths = record_paths
+        # the batch is kept and the retry waits for the flush interval
+        self.assertEqual(history_daemon.pending, ["/a", "/b", "/c"])
+        self.assertFalse(history_daemon.is_flush_required())
+        with open(daemon.get_errors_log_filename(self.config)) as afile:
+            self.assertIn("No space left on device", afile.read())
+
+        history_daemon.flush()
+        self.assertEqual(self.read_history(), ["/c", "/b", "/a"])
+        self.assertEqual(history_daemon.pending, [])
+        self.assertFalse(history_daemon.flush_failed)
+
+    def test_batch(self):
+        self.start()
+        for path in ["/a", "/b"]:
+            client.send_path(path, self.socket_path)
+        self.assertTrue(wait_for(lambda: len(self.daemon.pending) == 2))
+        self.assertEqual(self.read_history(), [])
+        client.send_path("/c", self.socket_path)
+        self.assertTrue(wait_for(lambda: self.read_history() == ["/c", "/b", "/a"]))
+
+    def test_flush_on_stop(self):
+        self.start()
+        client.send_path("/a", self.socket_path)
+        self.assertTrue(wait_for(lambda: self.daemon.pending))
+        self.daemon.stop()
+        self.thread.join(2)
+        self.thread = None
+        self.assertEqual(self.read_history(), ["/a"])
+        self.assertFalse(os.path.exists(self.socket_path))
+
+    def test_reload_wakes_up(self):
+        reloaded = threading.Event()
+
+        class Daemon(daemon.HistoryDaemon):
+            def reload_config(self):
+                self.reload_requested = False
+                reloaded.set()
+
+        self.start(Daemon)
+        self.daemon.request_reload()
+        # there are no datagrams to wake up the loop
+        self.assertTrue(reloaded.wait(2))
+
+    def test_no_daemon(self):
+        with self.assertRaises(OSError):
+            client.send_path("/a", self.socket_path)
+
+    def test_not_private_dir(self):
+        self.start()
+        os.chmod(os.path.dirname(self.socket_path), 0o755)
+        with self.assertRaises(OSError):
+            client.send_path("/a", self.socket_path)
+        self.assertRaises(daemon.DaemonError, daemon.HistoryDaemon(self.config, self.socket_path + "2").bind)
+
+    def test_already_running(self):
+        self.start()
+        self.assertRaises(daemon.DaemonError, daemon.HistoryDaemon(self.config, self.socket_path).bind)
+        with self.assertRaises(SystemExit) as context:
+            daemon.run(self.config, self.socket_path)
+        self.assertIn("already running", str(context.exception.code))
+        # the running daemon isn't affected
+        client.send_path("/a", self.socket_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
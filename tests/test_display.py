@@ -0,0 +1,167 @@
+import os
+import sys
+import select
+import threading
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fastcd import search
+
+# display module exits if urwid is missing
+try:
+    import urwid
+except ImportError:
+    urwid = None
+
+if urwid:
+    from fastcd import display
+
+
+@unittest.skipIf(urwid is None, "urwid is not installed")
+class PathListWalkerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.paths = ["/a", "/b/a", "/c", "/d/a", "/e/a"]
+        self.states = [True, False, True, None, True]
+
+    def test_edges(self):
+        walker = display.PathListWalker(self.paths, self.states)
+        self.assertEqual(walker.get_focus(), (None, None))
+        self.assertEqual(walker.get_next(0), (None, None))
+        self.assertEqual(walker.get_prev(0), (None, None))
+
+        walker.set_entries([(index, None, self.states[index]) for index in range(3)])
+        widget, position = walker.get_focus()
+        self.assertEqual((widget.get_path(), position), ("/a", 0))
+        self.assertEqual(walker.get_prev(0), (None, None))
+        widget, position = walker.get_next(0)
+        self.assertEqual((widget.get_path(), position), ("/b/a", 1))
+        self.assertEqual(walker.get_next(2), (None, None))
+        widget, position = walker.get_prev(2)
+        self.assertEqual((widget.get_path(), position), ("/b/a", 1))
+
+        walker.set_focus(2)
+        widget, position = walker.get_focus()
+        self.assertEqual((widget.get_path(), position), ("/c", 2))
+        # new entries reset the focus
+        walker.set_entries([(4, None, True)])
+        self.assertEqual(walker.get_focus()[1], 0)
+        self.assertEqual(walker.get_next(0), (None, None))
+
+    def test_stream(self):
+        corpus = search.Corpus(self.paths)
+        stream = search.MatchStream(search.RegexSearchEngine("a", False), corpus, chunk_size=1)
+        walker = display.PathListWalker(self.paths, self.states, page_size=1)
+        walker.set_stream(stream)
+        # only the first page is fetched
+        self.assertEqual(len(walker), 2)
+        widget, position = walker.get_next(1)
+        self.assertEqual((widget.get_path(), position), ("/d/a", 2))
+        self.assertEqual(walker.entries[2], (3, (3, 4), None))
+        widget, position = walker.get_next(2)
+        self.assertEqual((widget.get_path(), position), ("/e/a", 3))
+        self.assertEqual(walker.get_next(3), (None, None))
+        self.assertIsNone(walker.stream)
+
+
+class FakeLoop(object):
+    # pipe of the urwid main loop, the test reads it instead of the loop
+    def watch_pipe(self, callback):
+        self.read_fd, write_fd = os.pipe()
+        return write_fd
+
+    def read_pipe(self, timeout=2.0):
+        if not select.select([self.read_fd], [], [], timeout)[0]:
+            return None
+        return os.read(self.read_fd, 1024)
+
+
+class FakeStream(object):
+
+    def __init__(self, blocking=False, error=None):
+        self.started = threading.Event()
+        self.released = threading.Event()
+        self.error = error
+        if not blocking:
+            self.released.set()
+
+    def fetch(self, count=None, cancelled=None):
+        self.started.set()
+        self.released.wait(2)
+        if self.error:
+            raise self.error
+        return True
+
+
+class FailingEngine(search.SearchEngine):
+
+    def __init__(self, pattern, case_sensitive):
+        self.case_sensitive = case_sensitive
+
+    def search(self, string, pos=0, folded=None):
+        raise ValueError("broken engine")
+
+
+@unittest.skipIf(urwid is None, "urwid is not installed")
+class SearchWorkerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = FakeLoop()
+        self.delivered = []
+        self.errors = []
+        self.worker = display.SearchWorker(self.loop, lambda stream, payload: self.delivered.append(payload),
+                                           lambda error, payload: self.errors.append((str(error), payload)))
+
+    def test_deliver(self):
+        self.worker.submit(FakeStream(), 10, "first")
+        self.assertTrue(self.worker.is_pending())
+        self.worker.on_result(self.loop.read_pipe())
+        self.assertEqual(self.delivered, ["first"])
+        self.assertFalse(self.worker.is_pending())
+
+    def test_stale_result(self):
+        stale = FakeStream(blocking=True)
+        self.worker.submit(stale, 10, "stale")
+        self.assertTrue(stale.started.wait(2))
+        self.worker.submit(FakeStream(), 10, "latest")
+        # the stale search finishes after it's superseded
+        stale.released.set()
+        self.worker.on_result(self.loop.read_pipe())
+        self.assertEqual(self.delivered, ["latest"])
+        self.assertIsNone(self.loop.read_pipe(0.1))
+        self.assertFalse(self.worker.is_pending())
+
+    def test_cancel(self):
+        self.worker.submit(FakeStream(), 10, "cancelled")
+        data = self.loop.read_pipe()
+        self.worker.cancel()
+        # result is already in the pipe, but it's dropped
+        self.worker.on_result(data)
+        self.assertEqual(self.delivered, [])
+        self.assertFalse(self.worker.is_pending())
+
+    def test_error(self):
+        corpus = search.Corpus(["/a", "/b"])
+        self.worker.submit(search.MatchStream(FailingEngine("a", False), corpus), 10, "failed")
+        self.worker.on_result(self.loop.read_pipe())
+        self.assertEqual(self.errors, [("broken engine", "failed")])
+        self.assertEqual(self.delivered, [])
+        self.assertFalse(self.worker.is_pending())
+        # the worker is still alive
+        self.worker.submit(FakeStream(), 10, "next")
+        self.worker.on_result(self.loop.read_pipe())
+        self.assertEqual(self.delivered, ["next"])
+
+    def test_stale_error(self):
+        stale = FakeStream(blocking=True, error=ValueError("stale"))
+        self.worker.submit(stale, 10, "stale")
+        self.assertTrue(stale.started.wait(2))
+        self.worker.submit(FakeStream(), 10, "latest")
+        stale.released.set()
+        self.worker.on_result(self.loop.read_pipe())
+        self.assertEqual((self.delivered, self.errors), (["latest"], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fastcd import indexer
+
+
+class IndexerTests(unittest.TestCase):
+
+    def make_dirs(self, root, paths):
+        for path in paths:
+            os.makedirs(os.path.join(root, path))
+
+    def index(self, filename, roots, max_depth=10, skip_list=None):
+        index = indexer.DirectoryIndex(filename).load()
+        worker = indexer.Indexer(index, skip_list or ["/\\.git$"], max_depth, threads=4)
+        worker.update(roots)
+        index.save()
+        return worker
+
+    def test_index(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            root = os.path.join(tmpdir, "repo")
+            filename = os.path.join(tmpdir, indexer.INDEX_NAME)
+            self.make_dirs(root, ["src/app/handlers", "src/lib", "docs", ".git/objects"])
+            os.symlink(os.path.join(root, "src"), os.path.join(root, "link"))
+
+            self.index(filename, [root])
+            expected = [root] + [os.path.join(root, path) for path in ["docs", "src", "src/app", "src/lib", "src/app/handlers"]]
+            self.assertEqual(indexer.read_index_paths(filename), expected)
+
+            # depth limit
+            self.index(filename, [root], max_depth=1)
+            self.assertEqual(indexer.read_index_paths(filename), expected[:3])
+
+    def test_incremental_update(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            root = os.path.join(tmpdir, "repo")
+            filename = os.path.join(tmpdir, indexer.INDEX_NAME)
+            self.make_dirs(root, ["a/b", "c"])
+            self.index(filename, [root])
+
+            self.make_trusted(filename)
+            index = indexer.DirectoryIndex(filename).load()
+            os.utime(os.path.join(root, "a"), (index.time - 1000, index.time - 1000))
+            os.mkdir(os.path.join(root, "a", "new"))
+            worker = self.index(filename, [root])
+            # only 'a' is listed again
+            self.assertEqual(worker.listed, 2)
+            self.assertEqual(worker.reused, 3)
+            self.assertIn(os.path.join(root, "a", "new"), indexer.read_index_paths(filename))
+
+    def make_trusted(self, filename):
+        # pretend that the index is old enough to be trusted
+        index = indexer.DirectoryIndex(filename).load()
+        index.time += 10
+        for path, mtime in index.entries.items():
+            os.utime(path, (index.time - 100, index.time - 100))
+            if mtime != indexer.UNLISTED:
+                index.entries[path] = os.stat(path).st_mtime_ns
+        index.save()
+
+    def test_new_roots(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            root = os.path.join(tmpdir, "repo")
+            filename = os.path.join(tmpdir, indexer.INDEX_NAME)
+            self.make_dirs(root, ["src/app/handlers", "src/lib"])
+            self.index(filename, [root], max_depth=1)
+            self.assertEqual(indexer.DirectoryIndex(filename).load().entries[os.path.join(root, "src")], indexer.UNLISTED)
+            self.make_trusted(filename)
+
+            # subdirectories of the directory at the depth limit weren't listed
+            nested = os.path.join(root, "src")
+            worker = self.index(filename, [root, nested], max_depth=1)
+            self.assertEqual(worker.reused, 1)
+            paths = indexer.read_index_paths(filename)
+            for path in ["src/app", "src/lib"]:
+                self.assertIn(os.path.join(root, path), paths)
+            self.assertNotIn(os.path.join(root, "src/app/handlers"), paths)
+
+    def test_front_coding(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, indexer.INDEX_NAME)
+            index = indexer.DirectoryIndex(filename)
+            index.roots = ["/a"]
+            index.entries = {"/a": 1, "/a/bc": 2, "/a/bd": 3, "/b": 4}
+            index.save()
+            with open(filename) as afile:
+                records = [line for line in afile.read().splitlines() if not line.startswith("#")]
+            self.assertEqual(records, ["0\t1\t/a", "2\t2\t/bc", "4\t3\td", "1\t4\tb"])
+            loaded = indexer.DirectoryIndex(filename).load()
+            self.assertEqual(loaded.entries, index.entries)
+            self.assertEqual(loaded.roots, ["/a"])
+
+
+if __name__ == '__main__':
+    unittest.main()
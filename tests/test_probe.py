@@ -0,0 +1,141 @@
+import os
+import sys
+import time
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fastcd import core, probe
+
+
+class ExistenceCheckerTests(unittest.TestCase):
+
+    def test_check(self):
+        checker = probe.ExistenceChecker(threads=4)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = [tmpdir, os.path.join(tmpdir, "missing")]
+            self.assertEqual(checker.check(paths), [True, False])
+        self.assertEqual(checker.check([]), [])
+
+    def test_hung_mount(self):
+        checker = probe.ExistenceChecker(threads=2, path_timeout=0.05, mount_timeout=1, mount_timeouts_limit=2)
+        checker.mount_points = ["/hung", "/"]
+        checker.network_mounts = {"/hung"}
+
+        def slow_probe(path):
+            if path.startswith("/hung/"):
+                time.sleep(1)
+            return True
+
+        start = time.time()
+        states = checker.check(["/hung/a", "/hung/b", "/hung/c", "/local"], probe=slow_probe)
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual(states, [None, None, None, True])
+        self.assertEqual(checker.dead_mounts, {"/hung"})
+        # mount is skipped for the rest of the session
+        self.assertEqual(checker.check(["/hung/d"], probe=slow_probe), [None])
+
+    def test_mount_points(self):
+        with tempfile.NamedTemporaryFile("w") as afile:
+            afile.write("proc /proc proc rw 0 0\nserver:/ /mnt/my\\040share nfs rw 0 0\n")
+            afile.flush()
+            self.assertEqual(probe.get_mount_points(afile.name), [("/mnt/my share", "nfs"), ("/proc", "proc")])
+
+    def test_network_filesystem(self):
+        for fstype in ["nfs4", "cifs", "fuse.sshfs", "9p"]:
+            self.assertTrue(probe.is_network_filesystem(fstype), fstype)
+        for fstype in ["ext4", "tmpfs", "fuse", "fuse.gvfsd-fuse"]:
+            self.assertFalse(probe.is_network_filesystem(fstype), fstype)
+
+    def test_slow_local_mount(self):
+        # mount deadline is applied to the network mounts only
+        checker = probe.ExistenceChecker(threads=2, path_timeout=1, mount_timeout=0.05)
+        checker.mount_points = ["/net", "/"]
+        checker.network_mounts = {"/net"}
+
+        def slow_probe(path):
+            time.sleep(0.02)
+            return True
+
+        paths = ["/local{}".format(i) for i in range(10)] + ["/net/a", "/net/b", "/net/c", "/net/d", "/net/e"]
+        states = checker.check(paths, probe=slow_probe)
+        self.assertEqual(states[:10], [True] * 10)
+        self.assertIn(None, states[10:])
+        self.assertEqual(checker.dead_mounts, {"/net"})
+
+    def test_many_paths(self):
+        checker = probe.ExistenceChecker(threads=8)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = [os.path.join(tmpdir, str(i)) for i in range(2000)]
+            for path in paths[::2]:
+                os.mkdir(path)
+            self.assertEqual(checker.check(paths), [True, False] * 1000)
+
+
+class ExistenceCacheTests(unittest.TestCase):
+
+    def test_check_existence(self):
+        checker = probe.ExistenceChecker(threads=2)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "cache.txt")
+            existing = os.path.join(tmpdir, "a")
+            missing = os.path.join(tmpdir, "b")
+            os.mkdir(existing)
+
+            cache = core.ExistenceCache(filename, ttl=600)
+            self.assertEqual(probe.check_existence(checker, cache, [existing, missing]), [True, False])
+            cache.save()
+
+            # fresh results are taken from the cache
+            os.rmdir(existing)
+            cache = core.ExistenceCache(filename, ttl=600)
+            cache.load()
+            self.assertEqual(probe.check_existence(checker, cache, [existing, missing]), [True, False])
+
+            # stale results are revalidated by parent mtime
+            cache = core.ExistenceCache(filename, ttl=0)
+            cache.load()
+            self.assertEqual(probe.check_existence(checker, cache, [existing, missing]), [False, False])
+
+    def test_append_records(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "cache.txt")
+            core.append_existence_records(filename, [tmpdir, os.path.join(tmpdir, "missing", "dir")])
+            cache = core.ExistenceCache(filename, ttl=600)
+            cache.load()
+            self.assertEqual(list(cache.entries), [tmpdir])
+            self.assertTrue(cache.get(tmpdir)[0])
+
+
+class ListingPrefetcherTests(unittest.TestCase):
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def test_prefetch(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            root = os.path.join(tmpdir, "root")
+            for name in ["a/x", "b/y", "c"]:
+                os.makedirs(os.path.join(root, name))
+            cache = core.ListingCache(os.path.join(tmpdir, "listing_cache.txt"), 100)
+            prefetcher = probe.ListingPrefetcher(cache, threads=2, children_limit=2)
+            prefetcher.prefetch([root, os.path.join(root, "missing")], with_children=True)
+            expected = [root] + [os.path.join(root, name) for name in ["a", "b"]]
+            self.assertTrue(self.wait_for(lambda: all(path in cache.entries for path in expected)))
+            self.assertTrue(self.wait_for(lambda: prefetcher.workers == 0))
+            # children limit
+            self.assertNotIn(os.path.join(root, "c"), cache.entries)
+            self.assertEqual(cache.entries[os.path.join(root, "a")][2], ["x"])
+
+            prefetcher.stop()
+            prefetcher.prefetch([os.path.join(root, "c")])
+            self.assertEqual(prefetcher.workers, 0)
+            self.assertNotIn(os.path.join(root, "c"), cache.entries)
+
+
+if __name__ == '__main__':
+    unittest.main()
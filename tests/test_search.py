@@ -1,10 +1,13 @@
 import os
 import sys
+import random
+import tempfile
+import threading
 import unittest
 
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "fastcd"))
 
-from search import FuzzySearchEngine, RegexSearchEngine
+from search import FuzzySearchEngine, RegexSearchEngine, BitapSearchEngine, MatchStream, Corpus, fold_case, get_engine, is_narrowing
 
 
 class FuzzyEngineTests(unittest.TestCase):
@@ -86,6 +89,301 @@ class FuzzyEngineTests(unittest.TestCase):
         self.compare_finditer("fsat", "fast faster fastest", ["fast", "fast", "fast"])
         self.compare_finditer("fsta", "fast faster fastest", [])
 
+    def test_table_driven_automaton(self):
+        class GraphFuzzySearchEngine(FuzzySearchEngine):
+            search_automaton = FuzzySearchEngine.search_automaton_graph
+
+        rnd = random.Random(0)
+        for pattern in ["fast", "fsat*fats$", "pr/fast", "aaab", "ab*ba*ab"]:
+            table = FuzzySearchEngine(pattern, narrowing_parts=["/"])
+            graph = GraphFuzzySearchEngine(pattern, narrowing_parts=["/"])
+            for _ in range(200):
+                string = "".join(rnd.choice("abfstr/ ") for _ in range(rnd.randint(0, 30)))
+                self.assertEqual(table.search(string), graph.search(string), (pattern, string))
+
+    def test_dump_dot(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "fda.dot")
+            FuzzySearchEngine("p*fast*and furious$", narrowing_parts=["furi"]).dump_dot(filename)
+            with open(filename) as afile:
+                data = afile.read()
+        self.assertTrue(data.startswith("digraph G{"))
+        self.assertIn('[label="*"]', data)
+        self.assertIn('->"EOL"', data)
+
+
+class CaseFoldingTests(unittest.TestCase):
+
+    def test_fold_case(self):
+        self.assertEqual(fold_case("Pretty FAST"), "pretty fast")
+        self.assertEqual(fold_case("ΣΊΣΥΦΟΣ"), "σίσυφοσ")
+        for string in ["Straße", "İstanbul", "ﬁle", "ŉ"]:
+            self.assertEqual(len(fold_case(string)), len(string))
+
+    def test_prefolded_search(self):
+        corpus = Corpus(["~/Straße/ФАСТ", "~/İstanbul/fast"])
+        for engine in (FuzzySearchEngine("фаст"), RegexSearchEngine("фаст")):
+            match = engine.search(corpus.strings[0], folded=corpus.folded[0])
+            self.assertEqual(match, engine.search(corpus.strings[0]))
+            self.assertEqual(match.group(), "ФАСТ")
+        for engine in (FuzzySearchEngine("bul/fast"), RegexSearchEngine("bul/fast")):
+            match = engine.search(corpus.strings[1], folded=corpus.folded[1])
+            self.assertEqual(match.group(), "bul/fast")
+            self.assertEqual(match.start(), 7)
+
+
+class CorpusTests(unittest.TestCase):
+
+    def test_strings(self):
+        strings = ["~/Src/Straße", "", "/tmp", "~/İstanbul", ""]
+        default_block_size = Corpus.fold_block_size
+        for fold_block_size in (1, 2, default_block_size):
+            Corpus.fold_block_size = fold_block_size
+            try:
+                corpus = Corpus(strings)
+            finally:
+                Corpus.fold_block_size = default_block_size
+            self.assertEqual(len(corpus), len(strings))
+            self.assertEqual(list(corpus.strings), strings)
+            self.assertEqual([corpus.strings[i] for i in range(len(strings))], strings)
+            self.assertEqual(list(corpus.folded), [fold_case(string) for string in strings])
+            self.assertEqual(corpus.strings[-2], "~/İstanbul")
+            self.assertEqual(corpus.strings[1:4], strings[1:4])
+            self.assertEqual(corpus.folded.get_range(0, 3), ["~/src/straße", "", "/tmp"])
+            self.assertEqual(corpus.strings.get_range(3, 5), strings[3:])
+
+    def test_compact(self):
+        self.assertEqual(list(Corpus([]).strings), [])
+        # folded buffer is shared with the already folded strings
+        corpus = Corpus(["/a/b", "/c"])
+        self.assertIs(corpus.get_buffer(True)[0], corpus.get_buffer(False)[0])
+        self.assertEqual(corpus.get_buffer(True), ("/a/b\n/c", corpus.offsets))
+        self.assertEqual(list(corpus.offsets), [0, 5])
+
+
+class EngineCacheTests(unittest.TestCase):
+
+    def test_get_engine(self):
+        engine = get_engine(FuzzySearchEngine, "fast", False, minimal_fuzzy_pattern_len=3, narrowing_parts=["/"])
+        self.assertIs(engine, get_engine(FuzzySearchEngine, "fast", False, minimal_fuzzy_pattern_len=3, narrowing_parts=["/"]))
+        self.assertIsNot(engine, get_engine(FuzzySearchEngine, "fast", True, minimal_fuzzy_pattern_len=3, narrowing_parts=["/"]))
+        self.assertIsNot(engine, get_engine(FuzzySearchEngine, "fast", False, minimal_fuzzy_pattern_len=4, narrowing_parts=["/"]))
+        self.assertIsNot(engine, get_engine(RegexSearchEngine, "fast", False))
+        self.assertEqual(engine.search("pretty fsat"), FuzzySearchEngine("fast", narrowing_parts=["/"]).search("pretty fsat"))
+
+    def test_shared_engine(self):
+        engine = get_engine(FuzzySearchEngine, "/док", False, minimal_fuzzy_pattern_len=3, narrowing_parts=["/"])
+        strings = ["/{}/док{}".format(chr(0x400 + i), i) for i in range(200)]
+        expected = [bool(engine.search(string)) for string in strings]
+        classes = len(engine.symbol_classes)
+        results = []
+
+        def search():
+            results.append([bool(engine.search(string)) for string in reversed(strings)][::-1])
+
+        threads = [threading.Thread(target=search) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [expected] * 4)
+        # symbols are cached once
+        self.assertEqual(len(engine.symbol_classes), classes)
+        self.assertTrue(all(expected))
+
+
+def osa_distance(a, b):
+    # optimal string alignment distance
+    d = [[i + j if not i or not j else 0 for j in range(len(b) + 1)] for i in range(len(a) + 1)]
+    for i in range(1, len(a) + 1):
+        for j in range(1, len(b) + 1):
+            d[i][j] = min(d[i - 1][j] + 1, d[i][j - 1] + 1, d[i - 1][j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                d[i][j] = min(d[i][j], d[i - 2][j - 2] + 1)
+    return d[len(a)][len(b)]
+
+
+class BitapEngineTests(unittest.TestCase):
+
+    def compare_bitap(self, pattern, string, expected, start=None, max_errors=2):
+        engine = BitapSearchEngine(pattern, max_errors=max_errors, narrowing_parts=["/"])
+        match = engine.search(string)
+        if expected is None:
+            self.assertIsNone(match)
+        else:
+            self.assertIsNotNone(match)
+            self.assertEqual(match.group(), expected)
+            self.assertEqual(match.start(), start)
+
+    def test_direct(self):
+        strings = ["", "fast", "pretty Fast", "fast and furious", "fast fast fast", "/fast/furious/"]
+        patterns = ["a", "tt", "fast", "fast$", "fa*us", "fast*fast$", "/fur", "fast*/*$"]
+        for pattern in patterns:
+            for string in strings:
+                # patterns are too short for fuzzy search
+                engine = BitapSearchEngine(pattern, max_errors=0)
+                self.assertEqual(engine.search(string), RegexSearchEngine(pattern).search(string), (pattern, string))
+
+    def test_edits(self):
+        # transposition, substitution, insertion and deletion
+        self.compare_bitap("afst", "pretty fast", expected="fast", start=7)
+        self.compare_bitap("dast", "pretty fast", expected="fast", start=7)
+        self.compare_bitap("faast", "pretty fast", expected="fast", start=7)
+        self.compare_bitap("fst", "pretty fast", expected="fast", start=7)
+        self.compare_bitap("fast", "pretty fst", expected="fst", start=7)
+        self.compare_bitap("frious", "fast and furious", expected="furious", start=9)
+        # two errors in the long part
+        self.compare_bitap("furiuos", "fast and furious", expected="furious", start=9)
+        self.compare_bitap("fastandfurious", "fast and furious", expected="fast and furious", start=0)
+        self.compare_bitap("fastandfurious", "fast and furious", expected=None, max_errors=1)
+
+    def test_asterisks_and_eol(self):
+        self.compare_bitap("fast*fast", "fast fast fast", expected="fast fast", start=0)
+        self.compare_bitap("fast*fast$", "fast fast fast", expected="fast fast fast", start=0)
+        self.compare_bitap("das*us$", "fast and furious/", expected=None)
+        self.compare_bitap("/fasst/furios$", "/fast/furious", expected="/fast/furious", start=0)
+
+    def test_narrowing_parts(self):
+        self.compare_bitap("fast/fur", "fast/fur", expected="fast/fur", start=0)
+        self.compare_bitap("fast/fur", "fast_fur", expected=None)
+        self.compare_bitap("fast/fur", "fastfur", expected=None)
+
+    def test_finditer(self):
+        self.assertEqual([m.group() for m in BitapSearchEngine("fsat").finditer("fast faster fastest")], ["fast"] * 3)
+
+    def test_distance(self):
+        rand = random.Random(0)
+        for _ in range(500):
+            pattern = "".join(rand.choice("abc") for _ in range(rand.randint(3, 6)))
+            string = "".join(rand.choice("abc") for _ in range(rand.randint(0, 8)))
+            engine = BitapSearchEngine(pattern, max_errors=2, errors_step=1)
+            errors = engine.parts[0].errors
+            match = engine.search(string)
+            expected = any(
+                osa_distance(pattern, string[i:j]) <= errors
+                for i in range(len(string) + 1) for j in range(i, len(string) + 1))
+            self.assertEqual(match is not None, expected, (pattern, string))
+            if match:
+                self.assertLessEqual(osa_distance(pattern, match.group()), errors, (pattern, string))
+
+    def test_narrows(self):
+        self.assertTrue(BitapSearchEngine("fast").narrows(BitapSearchEngine("fas")))
+        self.assertTrue(BitapSearchEngine("fast*fur").narrows(BitapSearchEngine("fast")))
+        self.assertTrue(BitapSearchEngine("fast$fur").narrows(BitapSearchEngine("fast$")))
+        # more errors are allowed for the longer part
+        self.assertFalse(BitapSearchEngine("fas").narrows(BitapSearchEngine("fa")))
+        self.assertFalse(BitapSearchEngine("fastand").narrows(BitapSearchEngine("fastan")))
+        self.assertFalse(BitapSearchEngine("fast").narrows(BitapSearchEngine("fas", max_errors=1)))
+        self.assertFalse(BitapSearchEngine("fas").narrows(FuzzySearchEngine("fa")))
+
+
+class SearchManyTests(unittest.TestCase):
+
+    def get_reference(self, engine, corpus, indices, skip):
+        matches = []
+        for index in (range(len(corpus)) if indices is None else indices):
+            spans = [(m.start(), m.end()) for m in engine.finditer(corpus.strings[index])]
+            if len(spans) > skip:
+                matches.append((index,) + spans[skip])
+        return matches
+
+    def test_search_many(self):
+        corpus = Corpus(["/fast", "", "/Fast/Furious", "/pretty/fast/fast", "/fsat", "/fast and furious/", "/FAST"])
+        patterns = ["a", "/fast", "/fast$", "fast*/", "/f*s$", "/fsat", "*", "nothing"]
+        engines = [RegexSearchEngine, FuzzySearchEngine, BitapSearchEngine]
+        for engine_class in engines:
+            for pattern in patterns:
+                for case_sensitive in (False, True):
+                    engine = engine_class(pattern, case_sensitive)
+                    for indices in (None, [0, 2, 3], [5], range(1, 4), range(5, 7), range(6, 7)):
+                        for skip in (0, 1):
+                            self.assertEqual(
+                                engine.search_many(corpus, indices, skip),
+                                self.get_reference(engine, corpus, indices, skip),
+                                (engine_class.__name__, pattern, case_sensitive, indices, skip))
+
+    def test_empty_corpus(self):
+        self.assertEqual(RegexSearchEngine("*").search_many(Corpus([])), [])
+        self.assertEqual(FuzzySearchEngine("fast").search_many(Corpus([])), [])
+
+
+class MatchStreamTests(unittest.TestCase):
+
+    def setUp(self):
+        rand = random.Random(0)
+        words = ["src", "fast", "furious", "lib", "tests", "docs"]
+        self.corpus = Corpus("/" + "/".join(rand.choice(words) for _ in range(rand.randint(1, 4))) for _ in range(3000))
+
+    def test_fetch(self):
+        for engine in (RegexSearchEngine("/fast/fur"), FuzzySearchEngine("/fsat")):
+            expected = engine.search_many(self.corpus)
+            stream = MatchStream(engine, self.corpus, chunk_size=100)
+            stream.fetch(10)
+            self.assertEqual(stream.matches, expected[:10])
+            self.assertFalse(stream.exhausted)
+            # resume
+            stream.fetch(len(expected) // 2)
+            self.assertEqual(stream.matches, expected[:len(expected) // 2])
+            stream.fetch()
+            self.assertEqual(stream.matches, expected)
+            self.assertTrue(stream.exhausted)
+
+    def test_cancel(self):
+        stream = MatchStream(RegexSearchEngine("nothing"), self.corpus, chunk_size=100)
+        self.assertFalse(stream.fetch(10, cancelled=lambda: stream.last_scanned >= 1000))
+        self.assertEqual(stream.last_scanned, 1099)
+        self.assertTrue(stream.fetch(10))
+        self.assertTrue(stream.exhausted)
+
+    def test_narrowing_candidates(self):
+        previous = RegexSearchEngine("/fa")
+        engine = RegexSearchEngine("/fast/te")
+        expected = engine.search_many(self.corpus)
+        for count in (0, 5, 500, None):
+            stream = MatchStream(previous, self.corpus, chunk_size=100)
+            stream.fetch(count)
+            narrowed = MatchStream(engine, self.corpus, stream.get_narrowing_candidates())
+            narrowed.fetch()
+            self.assertEqual(narrowed.matches, expected, count)
+
+
+class NarrowingTests(unittest.TestCase):
+
+    def test_direct(self):
+        self.assertTrue(is_narrowing("fa", "fast"))
+        self.assertTrue(is_narrowing("fa", "fa*st$"))
+        self.assertFalse(is_narrowing("fast", "fa"))
+        self.assertFalse(is_narrowing("fat", "fast"))
+        self.assertFalse(is_narrowing("", "fast"))
+
+    def test_fuzzy(self):
+        # too short for fuzzy search on both sides
+        self.assertTrue(is_narrowing("/f", "/fa", fuzzy=True, narrowing_parts=["/"]))
+        # fuzzy search turns on
+        self.assertFalse(is_narrowing("/fa", "/fas", fuzzy=True, narrowing_parts=["/"]))
+        self.assertFalse(is_narrowing("fa", "fast", fuzzy=True))
+        # fuzzy on both sides
+        self.assertTrue(is_narrowing("fas", "fast", fuzzy=True))
+        # new parts are added
+        self.assertTrue(is_narrowing("fa", "fa*st", fuzzy=True))
+        self.assertTrue(is_narrowing("/fa", "/fa/furious", fuzzy=True, narrowing_parts=["/"]))
+        self.assertTrue(is_narrowing("fast$", "fast$x", fuzzy=True))
+
+    def check_subset(self, previous, pattern, strings, fuzzy):
+        engine = FuzzySearchEngine if fuzzy else RegexSearchEngine
+        prev_matched = {s for s in strings if engine(previous).search(s)}
+        matched = {s for s in strings if engine(pattern).search(s)}
+        self.assertTrue(matched <= prev_matched, (previous, pattern, matched - prev_matched))
+
+    def test_subset(self):
+        strings = ["fast", "fsat", "fats", "dast", "pretty fast", "fast and furious", "fst", "fast/furious"]
+        patterns = ["fas", "fast", "fast*fur", "fast*furi", "fsat", "fsat*", "fsat*o"]
+        for fuzzy in (False, True):
+            for previous in patterns:
+                for pattern in patterns:
+                    if is_narrowing(previous, pattern, fuzzy):
+                        self.check_subset(previous, pattern, strings, fuzzy)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,44 @@
+import os
+import sys
+import time
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fastcd import stages
+
+
+class StagesTests(unittest.TestCase):
+
+    def test_tracer(self):
+        tracer = stages.StageTracer()
+        with tracer.stage("load_config"):
+            time.sleep(0.01)
+        tracer.start("first draw")
+        tracer.start("widgets")
+        tracer.finish("widgets")
+        # unknown stage is ignored
+        tracer.finish("import")
+        breakdown = tracer.get_breakdown()
+        self.assertEqual([name for name, _ in breakdown], ["load_config", "widgets"])
+        self.assertGreaterEqual(breakdown[0][1], 0.01)
+
+    def test_log(self):
+        tracer = stages.StageTracer()
+        with tracer.stage("read history"):
+            pass
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, stages.LOG_NAME)
+            tracer.write_log(filename)
+            tracer.write_log(filename)
+            with open(filename) as afile:
+                lines = afile.read().splitlines()
+        self.assertEqual(len(lines), 6)
+        self.assertIn("pid {}".format(os.getpid()), lines[0])
+        self.assertTrue(lines[1].strip().startswith("total"))
+        self.assertTrue(lines[2].strip().startswith("read history"))
+
+
+if __name__ == '__main__':
+    unittest.main()